@@ -1,3 +1,7 @@
+# Project imports
+from neurotrends import session
+from neurotrends.trenddb import Article
+from neurotrends.tagxtract import loadhtml, loadpdf, loadpmc
 
 class ArtInfo(object):
   
@@ -11,6 +15,9 @@ class ArtInfo(object):
     self._doc_cache = {}
 
   def load_doc(self, doc_type):
+    """
+    Load document text, as stored in the document store; see docstore
+    """
     
     # Check cache
     if doc_type in self._doc_cache and self._doc_cache[doc_type]:
@@ -32,89 +39,10 @@ class ArtInfo(object):
     return doc_txt
 
   def _load_pdf(self):
-    
-    pdftxt = ''
-    pdftxtfile = file_path(self.artSQA.pmid, 'pdftxt', file_dirs)
-
-    if self.artSQA.pdftxtfile and os.path.exists(pdftxtfile):
-        
-      s = shelve.open(pdftxtfile)
-      pdftxt = s['pdfinfo']['txt']
-
-      # Update cache
-      self._doc_cache['pdf'] = pdftxt
-    
-    return pdftxt
-
-  def _load_html(self, method='soup'):
-
-    txt = ''
-    htmlfile = file_path(self.artSQA.pmid, 'html', file_dirs)
-
-    if self.artSQA.htmlfile and os.path.exists(htmlfile):
-
-      # Convert to plain text
-      html = ''.join(open(htmlfile, 'r').readlines())
-      
-      # Pad TDs
-      html = re.sub(
-        '<td(.*?)>(.*?)</td>', 
-        '<td\\1> \\2 </td>', 
-        html, 
-        flags=re.I
-      )
-      
-      try:
-        txt = ArtInfo._parse_html(html, method=method)
-      except:
-        return ''
-
-      txt = to_unicode(txt)
-      txt = parser.unescape(txt)
-
-    return txt
-  
-  @staticmethod
-  def _parse_html(html, method='soup'):
-    
-    if method == 'soup':
-
-      # Parse HTML
-      soup = BS(html)
-
-      # Remove <script> elements
-      [el.extract() for el in soup.findAll('script')]
-
-      # Assemble text
-      txt = ''.join(soup.findAll(text=True))
-
-    elif method == 'lxml':
-      
-      # Parse HTML
-      parse = lxml.html.fromstring(html)
-
-      # Extract text
-      txt = parse.text_content()
-
-    # Return text
-    return txt
-
-  def _load_pmc(self, method='soup'):
-      
-    pmcfile = file_path(self.artSQA.pmid, 'pmc', file_dirs)
-    print pmcfile
-    
-    html = ''
-
-    if self.artSQA.pmcfile and os.path.exists(pmcfile):
-
-      html = ''.join(open(pmcfile, 'r').readlines())
-      try:
-        html = parsehtml(html, method=method)
-      except:
-        return ''
+    return loadpdf(self.artSQA)
 
-      html = to_unicode(html)
-      html = parser.unescape(html)
+  def _load_html(self, method='fast'):
+    return loadhtml(self.artSQA, method=method)
 
-    return html
+  def _load_pmc(self, method='fast'):
+    return loadpmc(self.artSQA, method=method)
@@ -1,2 +1,5 @@
 from neurotrends import trenddb
-db, session = trenddb.getdb()
+
+# Engine is created on first use; see trenddb.Database
+database = trenddb.database
+session = trenddb.session
@@ -29,6 +29,12 @@ flaskdb = SQLAlchemy(app)
 
 pubptn = 'ncbi\.nlm\.nih\.gov/pubmed/(\d+)'
 
+@app.teardown_request
+def close_session(exception=None):
+
+  # Return connection to pool
+  session.remove()
+
 @app.errorhandler(404)
 def error404(e):
 
@@ -0,0 +1,489 @@
+'''
+Benchmarks for NeuroTrends.
+'''
+
+# Imports
+import sys
+import time
+import shutil
+import tempfile
+import subprocess
+
+# Time pattern import and group compilation in a fresh interpreter
+importscript = '''
+import sys, time
+import neurotrends
+t0 = time.time()
+from neurotrends import pattern
+t1 = time.time()
+pattern.tags.cachedir = sys.argv[1] or None
+groups = sys.argv[2:] or list(pattern.tags)
+for group in groups:
+    pattern.tags[group]
+t2 = time.time()
+print t1 - t0, t2 - t1
+'''
+
+def median(vals):
+
+    vals = sorted(vals)
+    return vals[len(vals) / 2]
+
+def runimport(cachedir, groups):
+
+    out = subprocess.check_output(
+        [sys.executable, '-c', importscript, cachedir] + list(groups)
+    )
+    return [float(val) for val in out.split()[-2:]]
+
+def benchimport(groups=[], nrep=5):
+    """
+    Time importing neurotrends.pattern and loading tag groups in new
+    processes, without the compiled-group cache, with an empty cache,
+    and with a filled cache
+    Arguments:
+        groups (list): Tag groups to load; if empty, load all groups
+        nrep (int): Number of processes per mode
+    """
+
+    cachedir = tempfile.mkdtemp()
+    results = {}
+
+    try:
+
+        for mode in ['nocache', 'cold', 'warm']:
+
+            times = []
+            for rep in range(nrep):
+                if mode == 'nocache':
+                    times.append(runimport('', groups))
+                    continue
+                if mode == 'cold':
+                    shutil.rmtree(cachedir, ignore_errors=True)
+                times.append(runimport(cachedir, groups))
+
+            results[mode] = (
+                median([tt[0] for tt in times]),
+                median([tt[1] for tt in times]),
+            )
+            print '%-8s import %.3fs groups %.3fs' % \
+                ((mode,) + results[mode])
+
+    finally:
+        shutil.rmtree(cachedir, ignore_errors=True)
+
+    return results
+
+def loaddocs(paths):
+    """
+    Read documents from text files
+    Arguments:
+        paths (list): Paths to text files
+    """
+
+    from BeautifulSoup import UnicodeDammit
+
+    docs = []
+    for path in paths:
+        with open(path) as f:
+            docs.append(UnicodeDammit(f.read()).unicode)
+
+    return docs
+
+def benchcontext(paths, groups=['proc', 'mod'], nrep=3, purge=True):
+    """
+    Compare contextsearch with precompiled ContextRules on the
+    ContextRules of tag groups
+    Arguments:
+        paths (list): Paths to text files
+        groups (list): Tag groups to benchmark
+        nrep (int): Number of repetitions
+        purge (bool): Clear the re module cache before each document,
+            as the other tag groups do in a full run
+    """
+
+    import re
+    from neurotrends import pattern
+
+    docs = loaddocs(paths)
+    results = {}
+
+    for group in groups:
+
+        # Load pattern module
+        pattern.tags[group]
+        mod = __import__(group)
+        rules = [rule for name, rule in sorted(vars(mod).items())
+            if isinstance(rule, mod.ContextRule)]
+
+        def runold():
+            res = []
+            for doc in docs:
+                if purge:
+                    re.purge()
+                res.extend([
+                    mod.contextsearch(doc, rule.priptn, rule.secptn,
+                        rule.negptn, rule.ichar, rule.npre, rule.npost)
+                    for rule in rules
+                ])
+            return res
+
+        def runnew():
+            res = []
+            for doc in docs:
+                if purge:
+                    re.purge()
+                # Fresh view, so that index building is timed
+                view = pattern.DocView(doc)
+                res.extend([rule.search(view) for rule in rules])
+            return res
+
+        # Check results
+        if runold() != runnew():
+            raise Exception('Results differ for group %s' % (group))
+
+        times = {}
+        for name, fun in [('contextsearch', runold), ('ContextRule', runnew)]:
+            reptimes = []
+            for rep in range(nrep):
+                start = time.time()
+                fun()
+                reptimes.append(time.time() - start)
+            times[name] = median(reptimes)
+        results[group] = times
+
+        print '%-6s %d rules contextsearch %.3fs ContextRule %.3fs' % \
+            (group, len(rules), times['contextsearch'], times['ContextRule'])
+
+    return results
+
+def benchhtml(paths, nrep=3):
+    """
+    Compare HTML-to-text extraction methods on raw HTML files, as in
+    loadhtml without the document store
+    Arguments:
+        paths (list): Paths to HTML files
+        nrep (int): Number of repetitions
+    """
+
+    from neurotrends import tagxtract
+
+    htmls = []
+    for path in paths:
+        with open(path) as f:
+            htmls.append(f.read())
+
+    def run(method):
+        txts = []
+        for html in htmls:
+            if method != 'fast':
+                html = tagxtract.padcells(html)
+            txt = tagxtract.parsehtml(html, method=method)
+            txt = tagxtract.to_unicode(txt)
+            if method != 'fast':
+                txt = tagxtract.parser.unescape(txt)
+            txts.append(txt)
+        return txts
+
+    results = {}
+    for method in ['soup', 'lxml', 'fast']:
+        reptimes = []
+        for rep in range(nrep):
+            start = time.time()
+            txts = run(method)
+            reptimes.append(time.time() - start)
+        results[method] = median(reptimes)
+        print '%-4s %d documents %.3fs %d characters' % \
+            (method, len(htmls), results[method], 
+                sum([len(txt) for txt in txts]))
+
+    return results
+
+def fillschema(session, narts, ntags=20, seed=0):
+    """
+    Fill a database with random articles, authors, and tags
+    Arguments:
+        session (Session): Database session
+        narts (int): Number of articles
+        ntags (int): Number of tags per group, each with 5 versions
+        seed (int): Random seed
+    """
+
+    import random
+    from neurotrends import trenddb
+
+    rnd = random.Random(seed)
+    nauths = narts * 2
+    nplaces = narts / 10 + 1
+    groups = ['pkg', 'tbx', 'proc', 'mod', 'spc', 'mag', 'pulse', 'des']
+
+    def insert(table, rows):
+        if rows:
+            session.execute(table.insert(), rows)
+
+    insert(trenddb.Place.__table__, [
+        {'id' : idx + 1, 'orig' : 'place %d' % (idx),
+            'wikiname' : 'wiki %d' % (idx), 'final' : 'place %d' % (idx)}
+        for idx in range(nplaces)
+    ])
+    insert(trenddb.Article.__table__, [
+        {'id' : idx + 1, 'pmid' : str(10000000 + idx),
+            'atitle' : 'article %d' % (idx),
+            'jtitle' : 'journal %d' % (idx % 50),
+            'pubyear' : str(1995 + idx % 18),
+            'place_id' : rnd.randint(1, nplaces)}
+        for idx in range(narts)
+    ])
+    insert(trenddb.Author.__table__, [
+        {'id' : idx + 1, 'lastname' : 'last%d' % (idx / 3),
+            'frstname' : 'F%d' % (idx % 3),
+            '_desc' : 'last%d, F%d' % (idx / 3, idx % 3)}
+        for idx in range(nauths)
+    ])
+
+    # Tags, with names, versions, and values
+    fields = []
+    attribs = []
+    links = []
+    for group in groups:
+        for tagidx in range(ntags):
+            name = 'tag%d' % (tagidx)
+            namefield = len(fields) + 1
+            fields.append({'id' : namefield, 'name' : group + 'name',
+                'value' : name})
+            for veridx in range(5):
+                verfield = len(fields) + 1
+                fields.append({'id' : verfield, 'name' : group + 'ver',
+                    'value' : str(veridx)})
+                attid = len(attribs) + 1
+                attribs.append({'id' : attid, 'name' : group,
+                    'category' : 'tool', '_desc' : '%s %d' % (name, veridx)})
+                links.append({'attrib_id' : attid, 'field_id' : namefield})
+                links.append({'attrib_id' : attid, 'field_id' : verfield})
+    insert(trenddb.Field.__table__, fields)
+    insert(trenddb.Attrib.__table__, attribs)
+    insert(trenddb.attribs_fields, links)
+
+    insert(trenddb.articles_attribs, [
+        {'article_id' : artid, 'attrib_id' : attid}
+        for artid in range(1, narts + 1)
+        for attid in rnd.sample(range(1, len(attribs) + 1), 20)
+    ])
+    insert(trenddb.articles_authors, [
+        {'article_id' : artid, 'author_id' : authid}
+        for artid in range(1, narts + 1)
+        for authid in rnd.sample(range(1, nauths + 1), 5)
+    ])
+
+    session.commit()
+
+def schemaqueries(session):
+    """
+    Query paths of tagplot.gettags, tagplot.plotvals, the /api search,
+    and main.addauths and main.artplace lookups
+    Arguments:
+        session (Session): Database session
+    """
+
+    from sqlalchemy import and_
+    from neurotrends.trenddb import Article, Attrib, Field, Author, Place
+
+    def gettags(supname, tagname, tagver=None):
+        q = Attrib.fields.any(and_(Field.name == supname + 'name',
+            Field.value == tagname))
+        if tagver is not None:
+            q = and_(q, Attrib.fields.any(and_(Field.name == supname + 'ver',
+                Field.value == tagver)))
+        return session.query(Attrib).filter(q).all()
+
+    def plotvals():
+        # Articles by tag version, as in plotvals(plottype='ver')
+        arts = {}
+        for tagidx in range(5):
+            for attrib in gettags('pkg', 'tag%d' % (tagidx)):
+                ver = attrib.fields['pkgver'].value
+                arts[ver] = set([art.pmid for attrib in
+                    gettags('pkg', 'tag%d' % (tagidx), tagver=ver)
+                    for art in attrib.articles])
+        return sorted([(ver, len(arts[ver])) for ver in arts])
+
+    def api():
+        # Search by PMID and by attribute, expanding results as sqla2dict
+        res = []
+        nart = session.query(Article).count()
+        for idx in range(0, nart, max(1, nart / 20)):
+            pmid = str(10000000 + idx)
+            arts = session.query(Article).filter_by(pmid=pmid).all()
+            for art in arts:
+                res.append((art.pmid,
+                    sorted([auth._desc for auth in art.authors]),
+                    sorted([(att._desc, sorted(att.fields))
+                        for att in art.attribs])))
+        return res
+
+    def lookups():
+        # Find Authors and Places by name
+        res = []
+        for idx in range(200):
+            res.append(session.query(Author).filter(and_(
+                Author.lastname == 'last%d' % (idx * 7),
+                Author.frstname == 'F1')).count())
+            res.append(session.query(Place).\
+                filter(Place.orig == 'place %d' % (idx)).count())
+            res.append(session.query(Place).\
+                filter(Place.wikiname == 'wiki %d' % (idx)).count())
+        return res
+
+    return [('gettags/plotvals', plotvals), ('api', api),
+        ('lookups', lookups)]
+
+def benchschema(sizes=['5000'], nrep=3):
+    """
+    Time query paths on SQLite databases of random articles, before
+    and after the index migration (schema version 4)
+    Arguments:
+        sizes (list): Numbers of articles
+        nrep (int): Number of repetitions
+    """
+
+    import os
+    from neurotrends import trenddb
+
+    results = {}
+
+    for size in sizes:
+
+        tmpdir = tempfile.mkdtemp()
+        try:
+
+            db, session = trenddb.getdb('sqlite',
+                os.path.join(tmpdir, 'bench.db'))
+            fillschema(session, int(size))
+
+            # Remove indexes added in version 4
+            for table in [trenddb.attribs_fields, trenddb.articles_attribs,
+                    trenddb.articles_authors, trenddb.Field.__table__,
+                    trenddb.Author.__table__, trenddb.Place.__table__]:
+                for index in table.indexes:
+                    if [col.name for col in index.columns] != ['key']:
+                        index.drop(db)
+            trenddb.setversion(session, 3)
+            session.commit()
+
+            times = {}
+            checks = {}
+            for mode in ['before', 'after']:
+                if mode == 'after':
+                    trenddb.upgrade(db, session, verbose=False)
+                for name, fun in schemaqueries(session):
+                    reptimes = []
+                    for rep in range(nrep):
+                        session.expire_all()
+                        start = time.time()
+                        res = fun()
+                        reptimes.append(time.time() - start)
+                    times[(mode, name)] = median(reptimes)
+                    if checks.setdefault(name, res) != res:
+                        raise Exception('Results differ for %s' % (name))
+
+            for name, fun in schemaqueries(session):
+                print '%-16s %s articles before %.3fs after %.3fs' % \
+                    (name, size, times[('before', name)],
+                        times[('after', name)])
+            results[size] = times
+
+            session.close()
+
+        finally:
+            shutil.rmtree(tmpdir, ignore_errors=True)
+
+    return results
+
+def benchdesc(sizes=['4000'], nrep=3):
+    """
+    Time loading all Attribs and Authors with their descriptions, as
+    sqla2dict does, updating all Attribs, and creating Attribs and 
+    Authors, on SQLite databases of random tags
+    Arguments:
+        sizes (list): Numbers of Attribs; there are as many Authors
+        nrep (int): Number of repetitions
+    """
+
+    import os
+    from neurotrends import trenddb
+
+    results = {}
+
+    for size in sizes:
+
+        ntags = max(1, int(size) / 40)
+        tmpdir = tempfile.mkdtemp()
+        try:
+
+            db, session = trenddb.getdb('sqlite',
+                os.path.join(tmpdir, 'bench.db'))
+            fillschema(session, ntags * 20, ntags=ntags)
+            def loadattribs():
+                return [attobj._desc 
+                    for attobj in session.query(trenddb.Attrib).all()]
+
+            def loadauthors():
+                return [authobj._desc
+                    for authobj in session.query(trenddb.Author).all()]
+
+            def update():
+                for attobj in session.query(trenddb.Attrib).all():
+                    attobj.category = 'tool'
+                session.flush()
+                session.rollback()
+
+            def create():
+                for idx in range(500):
+                    fieldobj = trenddb.Field(name='benchname', 
+                        value=str(idx))
+                    attobj = trenddb.Attrib(name='bench', category='bench',
+                        fields={fieldobj.name : fieldobj})
+                    attobj.category = 'tool'
+                    session.add(attobj)
+                    session.add(trenddb.Author(lastname='bench%d' % (idx),
+                        frstname='B'))
+                session.flush()
+                session.rollback()
+
+            times = {}
+            for name, fun in [('load attribs', loadattribs),
+                    ('load authors', loadauthors), ('update', update),
+                    ('create', create)]:
+                reptimes = []
+                for rep in range(nrep):
+                    session.expunge_all()
+                    start = time.time()
+                    fun()
+                    reptimes.append(time.time() - start)
+                times[name] = median(reptimes)
+                print '%-12s %s attribs %.3fs' % (name, size, times[name])
+            results[size] = times
+
+            session.close()
+
+        finally:
+            shutil.rmtree(tmpdir, ignore_errors=True)
+
+    return results
+
+benchmarks = {
+    'import' : benchimport,
+    'context' : benchcontext,
+    'html' : benchhtml,
+    'schema' : benchschema,
+    'desc' : benchdesc,
+}
+
+if __name__ == '__main__':
+
+    if len(sys.argv) < 2 or sys.argv[1] not in benchmarks:
+        print 'Usage: python bench.py [%s] [args...]' % \
+            ('|'.join(sorted(benchmarks)))
+        sys.exit(1)
+
+    benchmarks[sys.argv[1]](sys.argv[2:])
@@ -0,0 +1,155 @@
+'''
+Corpus-wide iteration for NeuroTrends. Documents are loaded on
+background threads while the caller processes earlier articles.
+'''
+
+# Imports
+import sys
+import Queue
+import itertools
+import threading
+import collections
+
+# Project imports
+import neurotrends as nt
+from neurotrends.trenddb import Article, or_
+from neurotrends.tagxtract import ArtStub, loadhtml, loadpdf, loadpmc
+
+# Document loaders by type
+loaders = {
+    'html' : loadhtml,
+    'pdf' : loadpdf,
+    'pmc' : loadpmc,
+}
+
+class Pending(object):
+    """
+    Result of a background call
+    """
+
+    def __init__(self, item):
+        self.item = item
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+    def get(self):
+        # Wait with a timeout, so that Ctrl-C can interrupt
+        while not self.done.wait(0.5):
+            pass
+        if self.error is not None:
+            raise self.error[0], self.error[1], self.error[2]
+        return self.value
+
+def prefetch(fun, items, threads=4, depth=16):
+    """
+    Apply a function to items on background threads, yielding results
+    in order. At most depth results are pending at a time, so memory
+    is bounded if the caller is slower than the threads.
+    Arguments:
+        fun (function): Function of one item
+        items (iterable): Items
+        threads (int): Number of threads
+        depth (int): Maximum number of pending results
+    """
+
+    tasks = Queue.Queue()
+
+    def work():
+        while True:
+            pending = tasks.get()
+            if pending is None:
+                return
+            try:
+                pending.value = fun(pending.item)
+            except BaseException:
+                pending.error = sys.exc_info()
+            finally:
+                pending.done.set()
+
+    workers = [threading.Thread(target=work) for _ in range(threads)]
+    for worker in workers:
+        worker.daemon = True
+        worker.start()
+
+    queue = collections.deque()
+    items = iter(items)
+
+    try:
+        while True:
+            # Fill queue
+            while len(queue) < depth:
+                try:
+                    pending = Pending(next(items))
+                except StopIteration:
+                    break
+                queue.append(pending)
+                tasks.put(pending)
+            if not queue:
+                break
+            yield queue.popleft().get()
+    finally:
+        # Stop threads, including when the caller stops early
+        for worker in workers:
+            tasks.put(None)
+
+def query(minval=None, years=None, pmids=None, order='pmid'):
+    """
+    Get articles
+    Arguments:
+        minval (float): Minimum HTML or PDF verification value
+        years (list): Publication years
+        pmids (list): PubMed IDs
+        order (str): Article column to sort by
+    """
+
+    arts = nt.session.query(Article)
+
+    if minval is not None:
+        arts = arts.filter(or_(
+            Article.htmlval >= minval,
+            Article.pdfval >= minval
+        ))
+    if years is not None:
+        arts = arts.filter(Article.pubyear.in_([str(year) for year in years]))
+    if pmids is not None:
+        arts = arts.filter(Article.pmid.in_(pmids))
+    if order:
+        arts = arts.order_by(getattr(Article, order))
+
+    return arts
+
+def loaddocs(job):
+    """
+    Load documents of an article
+    Arguments:
+        job (tuple): ArtStub and document types
+    """
+
+    stub, doc_types = job
+    return [loaders[doc_type](stub) if doc_type in doc_types else ''
+        for doc_type in ['html', 'pdf', 'pmc']]
+
+def iterdocs(arts=None, doc_types=['html', 'pdf', 'pmc'], threads=4,
+        depth=16, **kwargs):
+    """
+    Iterate over articles with their documents. Documents are loaded
+    from article columns copied in this thread, so background threads
+    do not use the database session.
+    Arguments:
+        arts (list): Articles; if None, get articles from query
+        doc_types (list): Documents to load; others are ''
+        threads (int): Number of loading threads
+        depth (int): Maximum number of loaded articles not yet yielded
+        kwargs: Filters and order for query
+    Yields (Article, HTML text, PDF text, PMC text) tuples
+    """
+
+    if arts is None:
+        arts = query(**kwargs).all()
+
+    jobs = ((ArtStub(art), doc_types) for art in arts)
+    docs = prefetch(loaddocs, jobs, threads=threads, depth=depth)
+
+    for art, (html, pdf, pmc) in itertools.izip(arts, docs):
+        yield art, html, pdf, pmc
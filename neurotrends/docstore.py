@@ -0,0 +1,415 @@
+'''
+Document text store for NeuroTrends. Texts are appended to a single
+data file and located through an append-only index of offsets; reads
+are served from a memory map of the data file.
+'''
+
+# Imports
+import os
+import sys
+import mmap
+import fcntl
+import shelve
+import threading
+
+from BeautifulSoup import UnicodeDammit
+
+# Project imports
+from neurotrends import trendpath
+
+# Index format version
+version = 1
+
+class DocStore(object):
+    """
+    Append-only store of document texts by kind (e.g. chtml, pdftxt)
+    and key (PubMed ID). Each record is appended to the data file and
+    then to the index, under a file lock, so that a record is visible
+    only once it is complete. A partly written index line is dropped
+    by the next writer. Superseded and deleted records stay in the data
+    file until the store is compacted.
+    Arguments:
+        path (str): Store directory
+    """
+
+    def __init__(self, path):
+
+        self.path = path
+        self.idxfile = os.path.join(path, 'docs.idx')
+        self.lockfile = os.path.join(path, 'docs.lock')
+
+        if not os.path.exists(path):
+            os.makedirs(path)
+
+        self.index = {}
+        self.datafile = None
+        self.mm = None
+        self.idxstat = None
+        self.idxpos = 0
+
+        # Serialize index updates between threads
+        self.mutex = threading.RLock()
+
+        self.refresh()
+
+    # Index
+
+    def refresh(self):
+        """
+        Read index records appended since the last read. If the store
+        was compacted, re-read the index and re-map the data file.
+        """
+
+        with self.mutex:
+            self._refresh()
+
+    def _refresh(self):
+
+        if not os.path.exists(self.idxfile):
+            with self.locked():
+                if not os.path.exists(self.idxfile):
+                    self.writeindex(self.idxfile, 'docs.0.dat', {})
+
+        stat = os.stat(self.idxfile)
+        if self.idxstat is None or stat.st_ino != self.idxstat.st_ino:
+            self.index = {}
+            self.idxpos = 0
+            self.unmap()
+        elif stat.st_size == self.idxpos:
+            return
+        self.idxstat = stat
+
+        with open(self.idxfile, 'rb') as f:
+            f.seek(self.idxpos)
+            tail = f.read()
+
+        # Ignore incomplete last line
+        end = tail.rfind('\n') + 1
+        lines = tail[:end].splitlines()
+        start = self.idxpos
+        self.idxpos += end
+
+        # Read header
+        if start == 0 and lines:
+            header = lines.pop(0).split()
+            if header[:2] != ['docstore', str(version)]:
+                raise Exception('Unknown document store format in %s' %
+                    (self.idxfile))
+            self.datafile = os.path.join(self.path, header[2])
+
+        for line in lines:
+            kind, key, offset, length = line.split('\t')
+            if int(length) < 0:
+                self.index.pop((kind, key), None)
+            else:
+                self.index[(kind, key)] = (int(offset), int(length))
+
+    def writeindex(self, idxfile, dataname, index):
+        """
+        Write a complete index and create its data file if missing
+        """
+
+        datafile = os.path.join(self.path, dataname)
+        if not os.path.exists(datafile):
+            open(datafile, 'ab').close()
+
+        with open(idxfile, 'wb') as f:
+            f.write('docstore %d %s\n' % (version, dataname))
+            for (kind, key), (offset, length) in sorted(index.items()):
+                f.write('%s\t%s\t%d\t%d\n' % (kind, key, offset, length))
+            f.flush()
+            os.fsync(f.fileno())
+
+    def locked(self):
+        """
+        Get exclusive lock on store. Opens the lock file on each call,
+        so that forked processes do not share the lock.
+        """
+
+        return FileLock(self.lockfile, self.mutex)
+
+    # Reading
+
+    def unmap(self):
+
+        # Buffers from getbytes keep old maps open
+        self.mm = None
+
+    def remap(self):
+        """
+        Map current data file
+        """
+
+        self.unmap()
+        if os.path.getsize(self.datafile):
+            with open(self.datafile, 'rb') as f:
+                self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def view(self, offset, length):
+        """
+        Get buffer over a record in the memory map
+        """
+
+        if not length:
+            return buffer('')
+        return buffer(self.mm, offset, length)
+
+    def mapped(self, offset, length):
+
+        return not length or \
+            (self.mm is not None and offset + length <= len(self.mm))
+
+    def lookup(self, kind, key):
+
+        key = str(key)
+        if (kind, key) not in self.index:
+            self.refresh()
+
+        return self.index.get((kind, key))
+
+    def getbytes(self, kind, key):
+        """
+        Get UTF-8 text of a document without copying
+        Arguments:
+            kind (str): Document kind
+            key (str): Document key
+        Returns buffer, or None if not stored
+        """
+
+        loc = self.lookup(kind, key)
+        if loc is None:
+            return None
+
+        # Re-map data file if it has grown or was replaced by compaction
+        if not self.mapped(*loc):
+            with self.locked():
+                self.refresh()
+                loc = self.index.get((kind, str(key)))
+                if loc is None:
+                    return None
+                if not self.mapped(*loc):
+                    self.remap()
+
+        return self.view(*loc)
+
+    def get(self, kind, key):
+        """
+        Get text of a document
+        Arguments:
+            kind (str): Document kind
+            key (str): Document key
+        Returns unicode, or None if not stored
+        """
+
+        data = self.getbytes(kind, key)
+        if data is None:
+            return None
+
+        return unicode(data, 'utf-8')
+
+    def __contains__(self, kindkey):
+
+        return self.lookup(*kindkey) is not None
+
+    def keys(self, kind=None):
+
+        self.refresh()
+        return sorted([key for key in self.index
+            if kind is None or key[0] == kind])
+
+    # Writing
+
+    def append(self, kind, key, data):
+        """
+        Append record to store
+        Arguments:
+            kind (str): Document kind
+            key (str): Document key
+            data (str): UTF-8 text, or None to delete
+        """
+
+        key = str(key)
+        if '\t' in kind + key or '\n' in kind + key:
+            raise Exception('Invalid document key %s/%s' % (kind, key))
+
+        with self.locked():
+
+            # Pick up compaction by other processes
+            self.refresh()
+
+            with open(self.idxfile, 'r+b') as idx:
+
+                # Drop incomplete line left by a failed writer
+                idx.seek(0, os.SEEK_END)
+                if idx.tell() > self.idxpos:
+                    idx.truncate(self.idxpos)
+
+                # Write data before index
+                if data is None:
+                    offset, length = 0, -1
+                else:
+                    with open(self.datafile, 'ab') as f:
+                        f.seek(0, os.SEEK_END)
+                        offset, length = f.tell(), len(data)
+                        f.write(data)
+                        f.flush()
+                        os.fsync(f.fileno())
+
+                idx.seek(self.idxpos)
+                idx.write('%s\t%s\t%d\t%d\n' % (kind, key, offset, length))
+                idx.flush()
+                os.fsync(idx.fileno())
+
+        self.refresh()
+
+    def put(self, kind, key, txt):
+        """
+        Store text of a document, replacing any stored text
+        Arguments:
+            kind (str): Document kind
+            key (str): Document key
+            txt (unicode): Document text
+        """
+
+        if not isinstance(txt, unicode):
+            txt = txt.decode('utf-8')
+
+        self.append(kind, key, txt.encode('utf-8'))
+
+    def delete(self, kind, key):
+
+        if (kind, key) in self:
+            self.append(kind, key, None)
+
+    def compact(self):
+        """
+        Rewrite data file without superseded or deleted records
+        """
+
+        with self.locked():
+
+            self.refresh()
+
+            # Get next data file name
+            olddata = self.datafile
+            gen = int(os.path.basename(olddata).split('.')[1]) + 1
+            dataname = 'docs.%d.dat' % (gen)
+            datafile = os.path.join(self.path, dataname)
+
+            # Copy live records in file order
+            self.remap()
+            index = {}
+            with open(datafile, 'wb') as f:
+                for kindkey, (offset, length) in sorted(self.index.items(),
+                        key=lambda item: item[1]):
+                    index[kindkey] = (f.tell(), length)
+                    f.write(self.view(offset, length))
+                f.flush()
+                os.fsync(f.fileno())
+
+            # Replace index
+            tmpfile = self.idxfile + '.tmp'
+            self.writeindex(tmpfile, dataname, index)
+            os.rename(tmpfile, self.idxfile)
+
+            # Remove old data; open maps remain valid
+            self.unmap()
+            os.remove(olddata)
+
+        self.refresh()
+
+class FileLock(object):
+
+    def __init__(self, path, mutex):
+        self.path = path
+        self.mutex = mutex
+
+    def __enter__(self):
+        self.mutex.acquire()
+        self.f = open(self.path, 'a')
+        fcntl.flock(self.f, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *args):
+        fcntl.flock(self.f, fcntl.LOCK_UN)
+        self.f.close()
+        self.mutex.release()
+
+# Stores by directory
+stores = {}
+
+def getstore(path=None):
+    """
+    Get document store, opening it on first use
+    Arguments:
+        path (str): Store directory; if None, use trendpath.docstore_dir
+    """
+
+    path = path or trendpath.docstore_dir
+    if path not in stores:
+        stores[path] = DocStore(path)
+
+    return stores[path]
+
+# Shelf files by kind, and the text of each shelf
+shelfkinds = {
+    'chtml' : lambda shelf: shelf['txt'],
+    'pdftxt' : lambda shelf: shelf['pdfinfo']['txt'],
+}
+
+def migrate(store=None, remove=False, verbose=True):
+    """
+    Copy texts from per-article shelf files into the document store.
+    Texts already in the store are kept.
+    Arguments:
+        store (DocStore): Target store; if None, use default store
+        remove (bool): Remove shelf files after copying?
+        verbose (bool): Print status?
+    """
+
+    store = store or getstore()
+
+    for kind in shelfkinds:
+
+        base_path = trendpath.file_dirs[kind]['base_path']
+        file_ext = trendpath.file_dirs[kind]['file_ext']
+
+        # Group shelf files by PubMed ID; dbm modules may add suffixes
+        shelffiles = {}
+        for name in os.listdir(base_path):
+            if '.%s' % (file_ext) in name:
+                shelffiles.setdefault(name.split('.')[0], []).append(name)
+        pmids = sorted(shelffiles)
+
+        for pmidx in range(len(pmids)):
+
+            pmid = pmids[pmidx]
+            if verbose:
+                print 'Migrating %s %d of %d...' % (kind, pmidx + 1,
+                    len(pmids))
+
+            shelfname = os.path.join(base_path, '%s.%s' % (pmid, file_ext))
+            if (kind, pmid) not in store:
+                try:
+                    shelf = shelve.open(shelfname, 'r')
+                    txt = shelfkinds[kind](shelf)
+                    shelf.close()
+                except Exception:
+                    print 'Could not read shelf %s' % (shelfname)
+                    continue
+                if txt and not isinstance(txt, unicode):
+                    txt = UnicodeDammit(txt).unicode
+                if txt:
+                    store.put(kind, pmid, txt)
+
+            # Only remove shelves whose text is in the store
+            if remove and (kind, pmid) in store:
+                for name in shelffiles[pmid]:
+                    os.remove(os.path.join(base_path, name))
+
+if __name__ == '__main__':
+
+    if len(sys.argv) > 1 and sys.argv[1] == 'compact':
+        getstore().compact()
+    elif len(sys.argv) > 1 and sys.argv[1] == 'migrate':
+        migrate(remove='--remove' in sys.argv)
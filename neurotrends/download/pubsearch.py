@@ -1,6 +1,7 @@
 # Import modules
 import os, re, sys
 import time, random
+import hashlib
 import urllib
 
 from BeautifulSoup import BeautifulSoup as bs
@@ -119,7 +120,7 @@ def artinfo(art):
   if not art['xml']:
     return None
  
-  artsoup = bs(art['xml'])
+  artsoup = art.get('soup') or bs(art['xml'])
   info = {}
   
   # Get abstract
@@ -209,6 +210,57 @@ def artinfo(art):
  
   return info
 
+# Fields of artinfo stored on Article
+infofields = ['abstxt', 'kwds', 'grants', 'sponsors', 'fpage', 'lpage', 
+  'auths']
+
+def xmlhash(xml):
+  
+  if isinstance(xml, unicode):
+    xml = xml.encode('utf-8')
+  return hashlib.sha1(xml).hexdigest()
+
+def artstore(dbobj, info, xml):
+  '''
+  Store fields parsed from PubMed XML on an article, so that later
+  jobs need not parse the XML again. Affiliation is only set if empty,
+  since it is also the geocoding query.
+  Arguments:
+    dbobj (Article): Article object
+    info (dict): Parsed fields from artinfo
+    xml (str): PubMed XML that info was parsed from
+  '''
+
+  dbobj.xmlhash = xmlhash(xml)
+
+  # Store plain unicode rather than BeautifulSoup strings
+  for field in infofields:
+    val = info[field]
+    if isinstance(val, list):
+      val = [[unicode(v) for v in item] if isinstance(item, list) 
+        else unicode(item) for item in val]
+    elif val is not None:
+      val = unicode(val)
+    setattr(dbobj, field, val)
+
+  if not dbobj.affil and info['affil']:
+    dbobj.affil = unicode(info['affil'])
+
+def artmeta(dbobj):
+  '''
+  Parse and store PubMed fields of an article if not yet stored
+  Arguments:
+    dbobj (Article): Article object
+  Returns True if fields are stored
+  '''
+
+  if dbobj.xmlhash is None and dbobj.xml:
+    info = artinfo({'xml' : dbobj.xml})
+    if info:
+      artstore(dbobj, info, dbobj.xml)
+
+  return dbobj.xmlhash is not None
+
 def artupdate(dbobj, artdict, overwrite=False):
   
   for field in artdict:
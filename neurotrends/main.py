@@ -200,6 +200,10 @@ def artdump(art, scraper, doc_types, overwrite=False):
         # Ensure documents saved in database
         for doc_type in doc_types:
             setattr(art, '%sfile' % (doc_type), short_name(out_files[doc_type]))
+
+        # Update TagFacts, which record whether documents exist
+        nt.session.flush()
+        trenddb.refreshfacts(nt.session, [art.id])
          
         # Save changes
         nt.session.commit()
@@ -241,6 +245,10 @@ def artdump(art, scraper, doc_types, overwrite=False):
         if out_files[doc_type]:
             setattr(art, '%sfile' % (doc_type), short_name(out_files[doc_type]))
 
+    # Update TagFacts, which record whether documents exist
+    nt.session.flush()
+    trenddb.refreshfacts(nt.session, [art.id])
+
     # Save changes
     nt.session.commit()
 
@@ -294,17 +302,25 @@ def buildart(art):
         art['pubday'] = art['info']['pubday']
 
     # Delete unused fields
+    info = art['info']
     del art['soup']; del art['info']
 
     # Update database
     if artobj:
         print 'Updating database...'
         pubsearch.artupdate(artobj, art, overwrite=True)
+        # Update TagFacts, which copy the publication year
+        nt.session.flush()
+        trenddb.refreshfacts(nt.session, [artobj.id])
     else:
         print 'Adding entry to database...'
         artobj = trenddb.Article(**art)
         nt.session.add(artobj)
 
+    # Store parsed fields
+    if info:
+        pubsearch.artstore(artobj, info, art['xml'])
+
     # Add authors
     addauths(artobj)
 
@@ -333,27 +349,58 @@ def batchaddauths():
     # Save changes
     nt.session.commit()
 
+def batchaddinfo(overwrite=False):
+    """
+    Parse PubMed XML of existing articles and store parsed fields
+    Arguments:
+        overwrite (bool): Re-parse articles with stored fields?
+    """
+
+    # Add columns
+    trenddb.upgrade(nt.database.engine, nt.session)
+
+    # Get articles
+    arts = nt.session.query(trenddb.Article).\
+        filter(trenddb.Article.xml != None)
+    if not overwrite:
+        arts = arts.filter(trenddb.Article.xmlhash == None)
+    arts = arts.order_by(trenddb.Article.pmid).all()
+
+    # Parse XML
+    for artidx in range(len(arts)):
+        art = arts[artidx]
+        print 'Working on article #%s, PMID %s...' % (artidx, art.pmid)
+        info = pubsearch.artinfo({'xml' : art.xml})
+        if info:
+            pubsearch.artstore(art, info, art.xml)
+        if artidx and artidx % 50 == 0:
+            nt.session.commit()
+
+    # Save changes
+    nt.session.commit()
+
 def addauths(art, commit=False):
     """
     Add authors to an article
     """
 
-    info = ''
+    auths = None
 
     if type(art) == dict:
         if 'info' in art and art['info']:
-            info = art['info']
+            auths = art['info']['auths']
         elif 'xml' in art and art['xml']:
-            info = pubsearch.artinfo(art)
+            auths = pubsearch.artinfo(art)['auths']
         artobj = nt.session.query(trenddb.Article).filter(trenddb.Article.pmid==art['pmid']).first()
     else:
         artobj = util.toart(art)
-        info = pubsearch.artinfo({'xml' : artobj.xml})
+        if artobj and pubsearch.artmeta(artobj):
+            auths = artobj.auths
 
-    if not info or not artobj:
+    if not auths or not artobj:
         return
 
-    for auth in info['auths']:
+    for auth in auths:
         
         last = auth[0]
         frst = auth[1]
@@ -376,8 +423,8 @@ def addauths(art, commit=False):
                 nt.session.add(authobj)
 
             # Append to article
-            if authobj not in art.authors:
-                art.authors.append(authobj)
+            if authobj not in artobj.authors:
+                artobj.authors.append(authobj)
 
     # Save changes
     if commit:
@@ -494,6 +541,8 @@ def addplace(art, overwrite=False, delay=True, commit=True):
     # Attach to article object
     if placeobj.lon and placeobj.lat:
         art.place = placeobj
+        nt.session.flush()
+        trenddb.refreshfacts(nt.session, [art.id])
 
     # Save changes
     if commit:
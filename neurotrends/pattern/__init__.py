@@ -1,38 +1,25 @@
-
 from base import *
+from scan import GroupScanner
+from document import Document, DocView, cleantxt
+from registry import TagRegistry
+import backend
+import ruleprof
 
 import os
 
-moddir = os.path.split(__file__)[0]
-ptnfiles = [mod.split('.')[0] for mod in os.listdir(moddir) if 
-  mod.endswith('.py') and mod not in ['__init__.py', 'base.py']]
-
-import imp
+# Project imports
+from neurotrends import trendpath
 
-# Add module directory to path
-import sys
-sys.path.insert(0, moddir)
+# Modules that do not define tags
+libfiles = ['__init__.py', 'base.py', 'scan.py', 'document.py',
+  'registry.py', 'backend.py', 'ruleprof.py']
 
-# Collect tags
-tags = {}
-for mod in ptnfiles:
-
-  # Load tag module
-  f, filename, description = imp.find_module(mod, __path__)
-  modtmp = imp.load_module(mod, f, filename, description)
-
-  # Compile tags
-  for tag in modtmp.tags:
-    modtmp.tags[tag] = comptag(modtmp.tags[tag])
+moddir = os.path.split(__file__)[0]
+ptnfiles = [mod.split('.')[0] for mod in os.listdir(moddir) if
+  mod.endswith('.py') and mod not in libfiles]
 
-  # Get category
-  if 'cat' in dir(modtmp):
-    cat = modtmp.cat
-  else:
-    cat = 'n/a'
+# Directory for compiled tag groups
+cachedir = '%s/pattern-cache' % (trendpath.data_dir)
 
-  # Append tags
-  tags[mod] = {
-    'cat' : cat,
-    'src' : modtmp.tags,
-  }
+# Collect tags; each group is compiled on first access
+tags = TagRegistry(moddir, ptnfiles, cachedir)
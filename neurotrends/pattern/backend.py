@@ -0,0 +1,142 @@
+# Import modules
+import re
+import signal
+
+# Get optional backends
+backends = {'re' : re}
+try:
+  import re2
+  backends['re2'] = re2
+except ImportError:
+  pass
+try:
+  import regex
+  backends['regex'] = regex
+except ImportError:
+  pass
+
+# Matching options
+options = {
+  'backend' : 're',     # Name of backend in backends
+  'budget' : None,      # Time budget per rule application (s)
+}
+
+# Rules that exceeded their budget, as (group, tag, rule, pmid)
+timeouts = []
+
+class RuleTimeout(Exception):
+  pass
+
+def setbackend(name):
+  """
+  Set matching backend. Rules compile on first use, so set the
+  backend before tagging any documents.
+  Arguments:
+    name (str): Backend name: re, re2, or regex
+  """
+
+  if name not in backends:
+    raise Exception('Backend %s not available' % (name))
+  options['backend'] = name
+
+def setbudget(budget):
+  """
+  Set time budget per rule application
+  Arguments:
+    budget (float): Budget in seconds; if None, no budget
+  """
+
+  options['budget'] = budget
+
+def compileptn(ptn, flags=0):
+  """
+  Compile pattern with current backend. Fall back to re for patterns
+  the backend cannot compile, e.g. look-behinds under re2.
+  Arguments:
+    ptn (str): Pattern string
+    flags (int): Regular expression flags
+  """
+
+  name = options['backend']
+
+  if name != 're':
+    try:
+      return backends[name].compile(ptn, flags)
+    except Exception:
+      pass
+
+  return re.compile(ptn, flags)
+
+def ruledesc(rule):
+
+  if getattr(rule, 'string', None):
+    return rule.string
+  fun = getattr(rule, 'fun', None)
+  if fun is not None:
+    return getattr(fun, '__name__', repr(fun))
+  return type(rule).__name__
+
+class Alarm(object):
+
+  def __init__(self):
+    self.armed = False
+    self.running = False
+    self.expired = False
+
+  def expire(self, signum, frame):
+    # Ignore alarms after the function has returned
+    if not self.running:
+      return
+    self.expired = True
+    raise RuleTimeout()
+
+alarm = Alarm()
+
+def runrule(rule, txt, fun, *args, **kwargs):
+  """
+  Call function within the time budget of a rule. Budgets use SIGALRM,
+  which also interrupts the stdlib matching engine, so they are only
+  enforced in the main thread; nested calls share the outer budget.
+  Arguments:
+    rule (Rule): Rule being applied
+    txt (str/DocView): Document text
+    fun (function): Function to call with args and kwargs
+  Returns result of fun; on timeout, records the rule and the PubMed ID
+  of the document in timeouts and returns None
+  """
+
+  budget = options['budget']
+  if not budget or alarm.armed:
+    return fun(*args, **kwargs)
+
+  # Set alarm; fails outside main thread
+  try:
+    handler = signal.signal(signal.SIGALRM, alarm.expire)
+  except ValueError:
+    return fun(*args, **kwargs)
+  alarm.armed, alarm.running, alarm.expired = True, True, False
+  signal.setitimer(signal.ITIMER_REAL, budget)
+
+  try:
+    result = fun(*args, **kwargs)
+    alarm.running = False
+  except RuleTimeout:
+    result = None
+  finally:
+    alarm.running = False
+    signal.setitimer(signal.ITIMER_REAL, 0)
+    signal.signal(signal.SIGALRM, handler)
+    alarm.armed = False
+
+  # Discard results if alarm was caught by the rule
+  if alarm.expired:
+    doc = getattr(txt, 'doc', None)
+    timeouts.append((
+      getattr(rule, 'group', None),
+      getattr(rule, 'tag', None),
+      ruledesc(rule),
+      getattr(doc, 'pmid', None),
+    ))
+    return None
+
+  return result
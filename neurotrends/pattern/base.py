@@ -1,6 +1,10 @@
 # Import modules
 import re
 import copy
+import bisect
+import time
+import sre_parse
+import sre_constants
 
 #########
 # Rules #
@@ -56,6 +60,17 @@ def makever(pkgname, pkgdict, vers, escchars='',
     negahead = '(?!' + negahead + ')'
   behind = posbehind + negbehind
   ahead = posahead + negahead
+
+  # Add escape characters
+  escvers = []
+  for ver in vers:
+    if type(vers) == dict:
+      escver = '(' + '|'.join(vers[ver]) + ')'
+    else:
+      escver = ver
+    for escchar in escchars:
+      escver = escver.replace(escchar, '\\' + escchar)
+    escvers.append((ver, escver))
       
   for boolptn in newdict['bool']:
 
@@ -63,15 +78,7 @@ def makever(pkgname, pkgdict, vers, escchars='',
     pkgptn = '(?:' + boolptn + ')'
   
     # Add known versions
-    for ver in vers:
-      
-      # Add escape characters
-      if type(vers) == dict:
-        escver = '(' + '|'.join(vers[ver]) + ')'
-      else:
-        escver = ver
-      for escchar in escchars:
-        escver = escver.replace(escchar, '\\' + escchar)
+    for ver, escver in escvers:
 
       # Assemble version pattern
       verptn = pkgptn + verfill + behind + escver + ahead
@@ -89,12 +96,24 @@ def makever(pkgname, pkgdict, vers, escchars='',
       else:
         newdict['arbit'].append(pkgptn + verfill + behind + arbptn + ahead)
 
+  # Add structure for anchored version extraction
+  newdict['verx'] = {
+    'bool' : newdict['bool'],
+    'vers' : escvers,
+    'behind' : behind,
+    'ahead' : ahead,
+    'arbit' : arbptn,
+  }
+
   return newdict
 
 def comptag(tag):
   
   if type(tag) == dict:
     for key in tag:
+      if key == 'verx':
+        tag[key] = VerRule(tag[key])
+        continue
       arbit = key == 'arbit'
       tag[key] = comprules(tag[key], arbit)
   elif type(tag) == list:
@@ -102,6 +121,25 @@ def comptag(tag):
   
   return tag
 
+def tagrules(tag):
+  """
+  Get rules of a compiled tag
+  Arguments:
+    tag (dict/list): Tag compiled by comptag
+  """
+
+  if type(tag) != dict:
+    return list(tag)
+
+  rules = []
+  for key in tag:
+    if type(tag[key]) == list:
+      rules.extend(tag[key])
+    else:
+      rules.append(tag[key])
+
+  return rules
+
 def comprules(rules, arbit=False):
   
   crules = []
@@ -113,6 +151,241 @@ def comprules(rules, arbit=False):
 
   return crules
 
+def maxwidth(parsed, items):
+  
+  width = sre_parse.SubPattern(parsed.pattern, list(items)).getwidth()[1]
+  if width >= sre_constants.MAXREPEAT - 1:
+    return None
+  return width
+
+def litfrags(parsed, pre=0):
+  """
+  Extract literal fragments required by a parsed regular expression
+  Arguments:
+    parsed (SubPattern): Pattern parsed by sre_parse
+    pre (int): Max offset of pattern from match start; None if unbounded
+  Returns list of (alternatives, maxpre) tuples: each match contains one
+  of the (lower-case) alternatives, starting at most maxpre characters
+  after the start of the match
+  """
+
+  frags = []
+  run = u''
+  runpre = pre
+
+  def closerun(run, runpre):
+    # Strip white-space so that unpadded text can be checked
+    strip = run.lstrip()
+    if runpre is not None:
+      runpre += len(run) - len(strip)
+    strip = strip.rstrip()
+    if strip:
+      frags.append(((strip,), runpre))
+
+  for idx in range(len(parsed)):
+
+    op, av = parsed[idx]
+    
+    # Extend literal run
+    if op == sre_constants.LITERAL:
+      if not run:
+        runpre = pre
+      run += unichr(av).lower()
+      if pre is not None:
+        pre += 1
+      continue
+
+    # Close literal run
+    if run:
+      closerun(run, runpre)
+      run = u''
+
+    if op == sre_constants.SUBPATTERN:
+      frags.extend(litfrags(av[-1], pre))
+    elif op in [sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT]:
+      if av[0] >= 1:
+        frags.extend(litfrags(av[2], pre))
+    elif op == sre_constants.BRANCH:
+      alts = []
+      altpre = pre
+      for branch in av[1]:
+        frag = bestfrag(litfrags(branch, pre))
+        if frag is None:
+          alts = []
+          break
+        alts.extend(frag[0])
+        if altpre is not None:
+          altpre = None if frag[1] is None else max(altpre, frag[1])
+      if alts:
+        frags.append((tuple(alts), altpre))
+    elif op == sre_constants.ASSERT and av[0] == 1:
+      # Look-ahead text must also be present
+      frags.extend(litfrags(av[1], pre))
+
+    # Update offset
+    if pre is not None:
+      width = maxwidth(parsed, [(op, av)])
+      pre = None if width is None else pre + width
+
+  if run:
+    closerun(run, runpre)
+
+  return frags
+
+def bestfrag(frags, minlen=1):
+  """
+  Pick the most selective literal fragment: fewest alternatives of 
+  three or more characters, then longest shortest alternative
+  """
+  
+  frags = [frag for frag in frags 
+    if min([len(alt) for alt in frag[0]]) >= minlen]
+  if not frags:
+    return None
+
+  return max(frags, key=lambda frag: fragscore(frag[0]))
+
+def fragscore(alts):
+  
+  short = min([len(alt) for alt in alts])
+  return (min(short, 3), -len(alts), short)
+
+def anchor(ptn, flags=srcflags, minlen=2):
+  """
+  Get literal anchor of a regular expression
+  Arguments:
+    ptn (str): Pattern string
+    flags (int): Regular expression flags
+    minlen (int): Shortest useful anchor
+  """
+
+  try:
+    parsed = sre_parse.parse(ptn, flags)
+  except Exception:
+    return None
+
+  return bestfrag(litfrags(parsed), minlen=minlen)
+
+def reqlits(ptn, flags=srcflags, minlen=2):
+  """
+  Get all literal fragments required by a regular expression, most
+  selective first
+  Arguments:
+    ptn (str): Pattern string
+    flags (int): Regular expression flags
+    minlen (int): Shortest useful alternative
+  """
+
+  try:
+    parsed = sre_parse.parse(ptn, flags)
+  except Exception:
+    return []
+
+  lits = []
+  for alts, _ in litfrags(parsed):
+    if min([len(alt) for alt in alts]) < minlen:
+      continue
+    alts = tuple(sorted(set(alts)))
+    if alts not in lits:
+      lits.append(alts)
+  
+  return sorted(lits, key=fragscore, reverse=True)
+
+# Patterns matching one character of each category
+catptns = {
+  sre_constants.CATEGORY_DIGIT : r'\d',
+  sre_constants.CATEGORY_NOT_DIGIT : r'\D',
+  sre_constants.CATEGORY_SPACE : r'\s',
+  sre_constants.CATEGORY_NOT_SPACE : r'\S',
+  sre_constants.CATEGORY_WORD : r'\w',
+  sre_constants.CATEGORY_NOT_WORD : r'\W',
+}
+
+def charmatch(op, av, char, flags):
+  """
+  Check whether a single-character pattern item can match a character
+  Arguments:
+    op: Operator from sre_parse
+    av: Argument from sre_parse
+    char (str): Character
+    flags (int): Regular expression flags
+  """
+
+  def same(code):
+    if flags & re.I:
+      return unichr(code).lower() == char.lower()
+    return unichr(code) == char
+
+  if op == sre_constants.LITERAL:
+    return same(av)
+  if op == sre_constants.NOT_LITERAL:
+    return not same(av)
+  if op == sre_constants.ANY:
+    return char != '\n' or bool(flags & re.S)
+  if op == sre_constants.IN:
+    negate = False
+    found = False
+    for iop, iav in av:
+      if iop == sre_constants.NEGATE:
+        negate = True
+      elif iop == sre_constants.RANGE:
+        found |= any([iav[0] <= ord(alt) <= iav[1] for alt in 
+          set([char, char.lower(), char.upper()])])
+      elif iop == sre_constants.CATEGORY:
+        if iav not in catptns:
+          return True
+        found |= bool(re.match(catptns[iav], char, flags & re.U))
+      else:
+        found |= charmatch(iop, iav, char, flags)
+    return found != negate
+
+  # Unknown item
+  return True
+
+def excludes(ptn, chars, flags=srcflags):
+  """
+  Check whether no match of a regular expression can contain any of
+  a set of characters. Conservative: returns False for look-aheads
+  and constructs it cannot analyze.
+  Arguments:
+    ptn (str): Pattern string
+    chars (str): Characters
+    flags (int): Regular expression flags
+  """
+
+  try:
+    parsed = sre_parse.parse(ptn, flags)
+  except Exception:
+    return False
+
+  def walk(parsed):
+    for op, av in parsed:
+      if op in [sre_constants.LITERAL, sre_constants.NOT_LITERAL,
+          sre_constants.ANY, sre_constants.IN]:
+        if any([charmatch(op, av, char, flags) for char in chars]):
+          return False
+      elif op == sre_constants.SUBPATTERN:
+        if not walk(av[-1]):
+          return False
+      elif op in [sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT]:
+        if not walk(av[2]):
+          return False
+      elif op == sre_constants.BRANCH:
+        if not all([walk(branch) for branch in av[1]]):
+          return False
+      elif op == sre_constants.AT:
+        continue
+      elif op == sre_constants.ASSERT_NOT or \
+          (op == sre_constants.ASSERT and av[0] == -1):
+        # Negative assertions and look-behinds neither extend the 
+        # match nor require literals
+        continue
+      else:
+        return False
+    return True
+
+  return walk(parsed)
+
 def getcontext(match=None, txt=None, ptn=None, 
     ncharpre=150, ncharpost=150):
 
@@ -128,36 +401,280 @@ def getcontext(match=None, txt=None, ptn=None,
   return ''
 
 from BeautifulSoup import UnicodeDammit
-class Rule():
+from document import DocView, padtxt
+from backend import compileptn, runrule
+import ruleprof
+class Rule(object):
   
   def __init__(self, rule, arbit=False):
-    self.string, self.regex, self.fun = (None, None, None)
+    self.string, self.flags, self.fun = (None, None, None)
+    self._regex = None
+    self.lits = []
     if type(rule) in [str, unicode]:
       self.string = rule
-      self.regex = re.compile(rule, srcflags)
+      self.flags = srcflags
       self.arbit = arbit
     elif hasattr(rule, 'pattern'):
       self.string = rule.pattern
-      self.regex = rule
+      self.flags = rule.flags
+      self._regex = rule
       self.arbit = arbit
     elif hasattr(rule, '__call__'):
       self.fun = rule
+    if self.string is not None:
+      self.lits = reqlits(self.string, self.flags)
+
+  @property
+  def regex(self):
+    # Compile on first use
+    if self._regex is None and self.string is not None:
+      self._regex = compileptn(self.string, self.flags)
+    return self._regex
+
+  def __getstate__(self):
+    # Compiled patterns are rebuilt on first use
+    state = self.__dict__.copy()
+    state['_regex'] = None
+    return state
+
+  def passes(self, lower):
+    """
+    Check whether required literals are present
+    Arguments:
+      lower (str): Lower-case document text
+    """
+    for alts in self.lits:
+      if isinstance(lower, str):
+        alts = [alt.encode('utf-8') for alt in alts]
+      if not any([alt in lower for alt in alts]):
+        return False
+    return True
+
+  def apply(self, txt, lower=None, presence=False):
+    profile = ruleprof.options['enabled']
+    if profile:
+      start = time.time()
+    result = runrule(self, txt, self.search, txt, lower, presence)
+    if result is None:
+      # Time budget exceeded
+      if self.fun is None and self.arbit:
+        result = []
+      else:
+        result = [(False, '')]
+    if profile:
+      if self.fun is None and self.arbit:
+        hit = bool(result)
+      else:
+        hit = any([res[0] for res in result])
+      ruleprof.record('rule', ruleprof.rulekey(self), start, hit)
+    return result
 
-  def apply(self, txt):
+  def search(self, txt, lower=None, presence=False):
+    if lower is None and isinstance(txt, DocView):
+      lower = txt.padlower
     if self.fun is not None:
       result = self.fun(txt)
       if result:
         return result
       return [(False, '')]
-    if self.regex:
+    if self.string is not None:
+      # Skip regex if required literals are missing
+      if lower is not None and not self.passes(lower):
+        if self.arbit:
+          return []
+        return [(False, '')]
       if self.arbit:
-        return flexsearch(self.regex, txt, fun=re.findall)
-      result = flexsearch(self.regex, txt)
-      if result:
-        context = getcontext(match=result, txt=txt)
+        return self.regex.findall(padtxt(txt))
+      result = self.regex.search(padtxt(txt))
+      return self.result(result, txt, presence)
+
+  def result(self, match, txt, presence=False):
+    if match:
+      # Skip context if only presence is needed
+      if presence:
+        return [(True, '')]
+      context = getcontext(match=match, txt=txt)
+      if not isinstance(context, unicode):
         context = UnicodeDammit(context).unicode
-        return [(True, context)]
-      return [(False, '')]
+      return [(True, context)]
+    return [(False, '')]
+
+# Maximum number of groups in a compiled pattern
+maxgroups = 100
+
+class VerRule(object):
+  """
+  Anchored version extraction for tags built by makever. Mentions of
+  each Boolean pattern are found once; known versions are matched only
+  at those mentions, using one pattern with a named group per version
+  and a lookup table from group names to versions. Patterns are compiled
+  on first use.
+  Arguments:
+    spec (dict): Version structure recorded by makever
+  """
+
+  def __init__(self, spec):
+
+    self.spec = spec
+    self.compiled = False
+
+  def __getstate__(self):
+    # Compiled patterns are rebuilt on first use
+    state = dict([(key, val) for key, val in self.__dict__.items()
+      if key in ['spec', 'group', 'tag']])
+    state['compiled'] = False
+    return state
+
+  def compile(self):
+
+    if self.compiled:
+      return
+    spec = self.spec
+
+    self.bools = [Rule(ptn) for ptn in spec['bool']]
+    self.starts = [compileptn('(?=' + ptn + ')', srcflags)
+      for ptn in spec['bool']]
+    self.prefixes = ['(?:' + ptn + ')' + verfill + spec['behind']
+      for ptn in spec['bool']]
+    self.ahead = spec['ahead']
+    self.vers = spec['vers']
+
+    # Version patterns by Boolean pattern, split to respect group limit
+    self.names = {}
+    self.known = []
+    for prefix in self.prefixes:
+      nbase = re.compile(prefix + self.ahead, srcflags).groups
+      ngroup, chunks, alts = nbase, [], []
+      for veridx, (ver, escver) in enumerate(self.vers):
+        name = 'v%d' % (veridx)
+        self.names[name] = ver
+        nver = re.compile(escver, srcflags).groups + 1
+        if alts and ngroup + nver > maxgroups:
+          chunks.append(self.join(prefix, alts))
+          ngroup, alts = nbase, []
+        alts.append('(?P<%s>%s)' % (name, escver))
+        ngroup += nver
+      if alts:
+        chunks.append(self.join(prefix, alts))
+      self.known.append(chunks)
+
+    # Single-version patterns, compiled on first use
+    self.single = {}
+
+    # Arbitrary-version patterns
+    self.arbit = []
+    if spec['arbit']:
+      self.arbit = [compileptn(prefix + spec['arbit'] + self.ahead, srcflags)
+        for prefix in self.prefixes]
+
+    self.compiled = True
+
+  def join(self, prefix, alts):
+    return compileptn(prefix + '(?:' + '|'.join(alts) + ')' + self.ahead,
+      srcflags)
+
+  def mentions(self, txt, boolidx):
+    """
+    Get start positions of a Boolean pattern in padded text
+    Arguments:
+      txt (str/DocView): Document text
+      boolidx (int): Index of Boolean pattern
+    """
+
+    cache = getattr(txt, 'cache', {})
+    key = ('mentions', self.starts[boolidx].pattern)
+
+    if key not in cache:
+      if isinstance(txt, DocView):
+        lower = txt.padlower
+      else:
+        lower = padtxt(txt).lower()
+      cache[key] = []
+      if self.bools[boolidx].passes(lower):
+        cache[key] = [match.start()
+          for match in self.starts[boolidx].finditer(padtxt(txt))]
+
+    return cache[key]
+
+  def findknown(self, txt):
+    """
+    Find known versions
+    Arguments:
+      txt (str/DocView): Document text
+    Returns set of (version, Boolean pattern index) tuples, matching
+    the version patterns built by makever
+    """
+
+    self.compile()
+    padded = padtxt(txt)
+    hits = set()
+
+    for boolidx in range(len(self.prefixes)):
+
+      for pos in self.mentions(txt, boolidx):
+
+        # Get first matching version in each chunk
+        found = set()
+        for regex in self.known[boolidx]:
+          match = regex.match(padded, pos)
+          if match:
+            found.update([self.names[name]
+              for name, val in match.groupdict().items() if val is not None])
+        if not found:
+          continue
+
+        # Check other versions at matching mention
+        for ver, escver in self.vers:
+          if ver in found or (ver, boolidx) in hits:
+            continue
+          key = (boolidx, ver)
+          if key not in self.single:
+            self.single[key] = compileptn(
+              self.prefixes[boolidx] + escver + self.ahead, srcflags)
+          if self.single[key].match(padded, pos):
+            found.add(ver)
+
+        hits.update([(ver, boolidx) for ver in found])
+
+    return hits
+
+  def findarbit(self, txt, boolidx):
+    """
+    Find arbitrary version
+    Arguments:
+      txt (str/DocView): Document text
+      boolidx (int): Index of Boolean pattern
+    Returns list containing the first non-empty result of findall
+    with the arbitrary-version pattern, or an empty list
+    """
+
+    self.compile()
+    padded = padtxt(txt)
+    regex = self.arbit[boolidx]
+    end = 0
+
+    for pos in self.mentions(txt, boolidx):
+
+      # Skip mentions overlapping previous match
+      if pos < end:
+        continue
+
+      match = regex.match(padded, pos)
+      if not match:
+        continue
+      end = max(match.end(), pos + 1)
+
+      # Format result as in findall
+      if regex.groups == 0:
+        res = match.group()
+      elif regex.groups == 1:
+        res = match.group(1) or ''
+      else:
+        res = tuple([grp or '' for grp in match.groups()])
+      if res:
+        return [res]
+
+    return []
 
 def flexsearch(ptn, txt, fun=re.search, flags=re.I, pad=True):
   
@@ -172,7 +689,7 @@ def flexsearch(ptn, txt, fun=re.search, flags=re.I, pad=True):
 
   # Text
   if pad:
-    searchargs['string'] = ' ' + txt + ' '
+    searchargs['string'] = padtxt(txt)
   else:
     searchargs['string'] = txt
 
@@ -186,6 +703,16 @@ def flexsearch(ptn, txt, fun=re.search, flags=re.I, pad=True):
 def contextsearch(txt, priptn, secptn=[], negptn=[], ichar='', 
     npre=150, npost=150):
 
+  if ruleprof.options['enabled']:
+    start = time.time()
+    result = _contextsearch(txt, priptn, secptn, negptn, ichar, npre, npost)
+    ruleprof.record('context', ('|'.join(priptn),), start, result[0][0])
+    return result
+
+  return _contextsearch(txt, priptn, secptn, negptn, ichar, npre, npost)
+
+def _contextsearch(txt, priptn, secptn, negptn, ichar, npre, npost):
+
   for pri in priptn:
 
     # Search for primary pattern
@@ -232,3 +759,215 @@ def contextsearch(txt, priptn, secptn=[], negptn=[], ichar='',
   
   # No results found
   return [(False, '')]
+
+class ContextRule(object):
+  """
+  Context search as in contextsearch, with all patterns compiled once.
+  On DocViews, negative and context patterns are only searched if their
+  required literals occur in the context of a primary match, within a
+  single clause for context patterns that cannot span ichar.
+  Arguments:
+    priptn (list): Primary patterns
+    secptn (list): Secondary patterns; if empty, any primary match
+      not excluded by negptn is accepted
+    negptn (list): Patterns excluding a primary match's context
+    ichar (str): Characters not allowed between primary and
+      secondary patterns
+    npre (int): Characters of context before primary match
+    npost (int): Characters of context after primary match
+  """
+
+  def __init__(self, priptn, secptn=[], negptn=[], ichar='',
+      npre=150, npost=150):
+
+    self.priptn = priptn
+    self.secptn = secptn
+    self.negptn = negptn
+    self.ichar = ichar
+    self.npre = npre
+    self.npost = npost
+
+    self.compiled = {}
+
+    # Negative patterns with required literals
+    self.neg = [(self.compile(ptn), self.literals(ptn)) for ptn in negptn]
+
+    # Primary patterns with context patterns
+    self.pri = []
+    for pri in priptn:
+      conptn = []
+      for sec in secptn or []:
+        if ichar:
+          # Ignore characters between primary 
+          # and secondary patterns
+          iptn = '[^%s]*' % (ichar)
+          conptn.append(pri + iptn + sec)
+          conptn.append(sec + iptn + pri)
+        else:
+          conptn.append(sec)
+      self.pri.append((
+        compileptn(pri, re.I),
+        [(self.compile(ptn), self.literals(ptn), self.clausal(ptn))
+          for ptn in conptn],
+      ))
+
+  def compile(self, ptn):
+
+    # Use flags as in flexsearch
+    if hasattr(ptn, 'pattern'):
+      return ptn
+    if ptn not in self.compiled:
+      self.compiled[ptn] = compileptn(ptn, re.I)
+    return self.compiled[ptn]
+
+  def literals(self, ptn):
+
+    # Most selective literals; short ones are too frequent to index
+    if hasattr(ptn, 'pattern'):
+      return reqlits(ptn.pattern, ptn.flags, minlen=4)[:3]
+    return reqlits(ptn, re.I, minlen=4)[:3]
+
+  def clausal(self, ptn):
+    """
+    Get clause boundaries that matches of a pattern cannot span
+    Returns ichar, or None if matches may span it
+    """
+
+    if not self.ichar:
+      return None
+    if hasattr(ptn, 'pattern'):
+      safe = excludes(ptn.pattern, self.ichar, ptn.flags)
+    else:
+      safe = excludes(ptn, self.ichar, re.I)
+    if safe:
+      return self.ichar
+    return None
+
+  def candidates(self, txt, lits, chars):
+    """
+    Get clauses of a DocView in which a context pattern may match
+    Arguments:
+      txt (DocView): Document text
+      lits (list): Required literals of pattern
+      chars (str): Clause boundaries; if None, whole document
+    Returns set of clause indices, or None if any clause may match
+    """
+
+    if not lits:
+      return None
+    if chars:
+      return txt.clauses(lits, chars)
+    if all([any([txt.litpos(alt) for alt in alts]) for alts in lits]):
+      return None
+    return set()
+
+  def possible(self, txt, lits, chars, cands, start, stop):
+    """
+    Check whether a context pattern may match in a span of a DocView
+    Arguments:
+      txt (DocView): Document text
+      lits (list): Required literals of pattern
+      chars (str): Clause boundaries
+      cands (set): Candidate clauses from candidates
+      start (int): Start of span
+      stop (int): End of span
+    """
+
+    if chars and cands is not None:
+      # Clause indices are numbers of preceding boundaries in
+      # padded text
+      bounds = txt.bounds(chars)
+      first = bisect.bisect_right(bounds, start + 1)
+      last = bisect.bisect_right(bounds, stop)
+      return any([clause in cands for clause in xrange(first, last + 1)])
+
+    return self.occurs(txt, lits[:1], start, stop)
+
+  def occurs(self, txt, lits, start, stop):
+    """
+    Check whether required literals occur in a span of a DocView
+    Arguments:
+      txt (DocView): Document text
+      lits (list): Literal alternatives, as from reqlits
+      start (int): Start of span
+      stop (int): End of span
+    """
+
+    for alts in lits:
+      found = False
+      for alt in alts:
+        # Positions refer to padded text
+        pos = txt.litpos(alt)
+        idx = bisect.bisect_left(pos, start + 1)
+        if idx < len(pos) and pos[idx] <= stop + 1 - len(alt):
+          found = True
+          break
+      if not found:
+        return False
+
+    return True
+
+  def search(self, txt, npre=None, npost=None):
+    """
+    Search text
+    Arguments:
+      txt (str): Text to search
+      npre (int): Override npre
+      npost (int): Override npost
+    """
+
+    if ruleprof.options['enabled']:
+      start = time.time()
+      result = self._search(txt, npre, npost)
+      ruleprof.record('context', ('|'.join(self.priptn),), start,
+        result[0][0])
+      return result
+
+    return self._search(txt, npre, npost)
+
+  def _search(self, txt, npre=None, npost=None):
+
+    if npre is None:
+      npre = self.npre
+    if npost is None:
+      npost = self.npost
+
+    # Check literals against document index
+    index = isinstance(txt, DocView)
+
+    for pri, conptn in self.pri:
+
+      if index:
+        cands = [self.candidates(txt, lits, chars) 
+          for ptn, lits, chars in conptn]
+        # Skip primary pattern if no context pattern can match
+        if self.secptn and not any([clauses is None or clauses 
+            for clauses in cands]):
+          continue
+
+      for match in pri.finditer(txt):
+
+        # Get context as in getcontext
+        start = max(0, match.start() - npre)
+        stop = min(match.end() + npost, len(txt))
+        context = txt[start : stop]
+        padded = ' ' + context + ' '
+
+        # Skip if negative match
+        if any([neg.search(padded) for neg, lits in self.neg
+            if not index or self.occurs(txt, lits, start, stop)]):
+          continue
+
+        # Return results
+        if not self.secptn:
+          return [(True, context)]
+
+        for conidx, (ptn, lits, chars) in enumerate(conptn):
+          if index and not self.possible(txt, lits, chars, 
+              cands[conidx], start, stop):
+            continue
+          if ptn.search(padded):
+            return [(True, context)]
+
+    # No results found
+    return [(False, '')]
@@ -1,7 +1,7 @@
 cat = 'analysis'
 
 # Import base
-from base import *
+from neurotrends.pattern.base import *
 
 # Check for event-related design
 priptn_event = [
@@ -37,8 +37,9 @@ negptn_event = [
   'plos',
   'frontiers',
 ]
+conrule_event = ContextRule(priptn_event, negptn=negptn_event, ichar='.')
 def checkevent(txt, **conargs):
-  return contextsearch(txt, priptn_event, negptn=negptn_event, ichar='.', **conargs)
+  return conrule_event.search(txt, **conargs)
 
 # Initialize tags
 tags = {}
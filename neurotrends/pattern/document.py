@@ -0,0 +1,154 @@
+# Import modules
+import re
+import bisect
+
+from BeautifulSoup import UnicodeDammit
+
+def cleantxt(txt, ptns):
+
+  ctxt = txt
+
+  for ptn in ptns:
+    ctxt = re.sub(ptn[0], ptn[1], ctxt)
+
+  return ctxt
+
+def padtxt(txt):
+  """
+  Pad text with spaces, as in flexsearch
+  Arguments:
+    txt (str/DocView): Text to pad
+  """
+
+  if isinstance(txt, DocView):
+    return txt.padded
+  return ' ' + txt + ' '
+
+class DocView(unicode):
+  """
+  Cleaned document text. Behaves as a unicode string; padded and
+  lower-case variants are computed on first use and cached, as are
+  any other per-view results stored in cache.
+  Arguments:
+    txt (unicode): Cleaned text
+    doc (Document): Parent document
+  """
+
+  def __new__(cls, txt, doc=None):
+    self = unicode.__new__(cls, txt)
+    self.doc = doc
+    self.cache = {}
+    return self
+
+  @property
+  def padded(self):
+    if 'padded' not in self.cache:
+      self.cache['padded'] = u' ' + self + u' '
+    return self.cache['padded']
+
+  @property
+  def padlower(self):
+    if 'padlower' not in self.cache:
+      self.cache['padlower'] = self.padded.lower()
+    return self.cache['padlower']
+
+  def litpos(self, lit):
+    """
+    Get positions of a literal in padded lower-case text, including
+    overlapping occurrences
+    Arguments:
+      lit (unicode): Lower-case literal
+    """
+
+    litpos = self.cache.setdefault('litpos', {})
+    if lit not in litpos:
+      lower = self.padlower
+      pos = []
+      idx = lower.find(lit)
+      while idx > -1:
+        pos.append(idx)
+        idx = lower.find(lit, idx + 1)
+      litpos[lit] = pos
+
+    return litpos[lit]
+
+  def bounds(self, chars):
+    """
+    Get positions of clause boundaries in padded text
+    Arguments:
+      chars (str): Boundary characters
+    """
+
+    key = ('bounds', chars)
+    if key not in self.cache:
+      self.cache[key] = [match.start() for match in 
+        re.finditer('[%s]' % (re.escape(chars)), self.padded)]
+
+    return self.cache[key]
+
+  def clauses(self, lits, chars):
+    """
+    Get clauses containing an occurrence of each of a list of literal 
+    alternatives
+    Arguments:
+      lits (list): Tuples of lower-case alternatives
+      chars (str): Boundary characters
+    Returns set of clause indices, numbered by preceding boundaries
+    """
+
+    key = ('clauses', chars, tuple(lits))
+    if key not in self.cache:
+      bounds = self.bounds(chars)
+      clauses = None
+      for alts in lits:
+        found = set()
+        for alt in alts:
+          for pos in self.litpos(alt):
+            clause = bisect.bisect_right(bounds, pos)
+            # Skip occurrences spanning a boundary
+            if bisect.bisect_right(bounds, pos + len(alt) - 1) == clause:
+              found.add(clause)
+        clauses = found if clauses is None else clauses & found
+        if not clauses:
+          break
+      self.cache[key] = clauses
+
+    return self.cache[key]
+
+class Document(object):
+  """
+  Document text with cached cleaned views. Text is decoded once;
+  each distinct clean pattern list is applied at most once.
+  Arguments:
+    txt (str): Document text
+    clean (list): Default clean patterns
+    xcept (dict): Tag -> clean patterns for non-default tags
+    pmid (str): PubMed ID of source article
+  """
+
+  def __init__(self, txt, clean=[], xcept={}, pmid=None):
+
+    if not isinstance(txt, unicode):
+      txt = UnicodeDammit(txt).unicode
+
+    self.txt = txt
+    self.clean = clean
+    self.xcept = xcept
+    self.pmid = pmid
+    self.views = {}
+
+  def view(self, tag=None):
+    """
+    Get cleaned text for a tag
+    Arguments:
+      tag (str): Tag name; if None or not in xcept, use
+        default clean patterns
+    """
+
+    ptns = self.xcept.get(tag, self.clean)
+    key = tuple(ptns)
+
+    if key not in self.views:
+      self.views[key] = DocView(cleantxt(self.txt, ptns), self)
+
+    return self.views[key]
@@ -12,7 +12,7 @@ import shelve
 from neurotrends import trendpath
 
 # Import base
-from base import *
+from neurotrends.pattern.base import *
 
 # Initialize tags
 tags = {}
@@ -1,7 +1,10 @@
 cat = 'tool'
 
+# Scan methods section only
+sections = ['methods']
+
 # Import base
-from base import *
+from neurotrends.pattern.base import *
 
 # Magnet attributes
 vendptn = 'siemens|philips|general%selectric|\Wge\W' % (delimptn)
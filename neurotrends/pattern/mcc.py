@@ -1,7 +1,7 @@
 cat = 'analysis'
 
 # Import base
-from base import *
+from neurotrends.pattern.base import *
 
 # Check Monte Carlo correction
 priptn_monte = [
@@ -10,8 +10,9 @@ priptn_monte = [
 secptn_monte = [
   'multiple%scomparison' % (delimptn),
 ]
+conrule_monte = ContextRule(priptn_monte, secptn_monte, ichar='.')
 def checkmonte(txt, **conargs):
-  return contextsearch(txt, priptn_monte, secptn_monte, ichar='.', **conargs)
+  return conrule_monte.search(txt, **conargs)
 
 # Initialize tags
 tags = {}
@@ -1,7 +1,7 @@
 cat = 'analysis'
 
 # Import base
-from base import *
+from neurotrends.pattern.base import *
 
 # Check HRF
 priptn_hrf = [
@@ -16,8 +16,9 @@ secptn_hrf = [
   'gamma%sfunction' % (delimptn),
   'variate%sfunction' % (delimptn),
 ]
+conrule_hrf = ContextRule(priptn_hrf, secptn_hrf)
 def checkhrf(txt, **conargs):
-  return contextsearch(txt, priptn_hrf, secptn_hrf, **conargs)
+  return conrule_hrf.search(txt, **conargs)
 
 # Check temporal derivative
 priptn_tmpdrv = [
@@ -26,8 +27,9 @@ priptn_tmpdrv = [
 secptn_tmpdrv = [
   'first%sderivative' % (delimptn),
 ]
+conrule_tmpdrv = ContextRule(priptn_tmpdrv, secptn_tmpdrv, ichar='.')
 def checktmpdrv(txt, **conargs):
-  return contextsearch(txt, priptn_tmpdrv, secptn_tmpdrv, ichar='.', **conargs)
+  return conrule_tmpdrv.search(txt, **conargs)
 
 synptn = '(?:spm|canonical|standard|synthetic|reference|(?:proto)?typical)'
 hrfptn = '(?:hrf|hdr|ha?emodynamic%s(?:impulse)?%sresponse)' % delimrep(2)
@@ -44,8 +46,9 @@ secptn_fir = [
   'shape%sof%s(?:the)?%sresponse' % delimrep(3),
   'time%scource' % (delimptn),
 ]
+conrule_fir = ContextRule(priptn_fir, secptn_fir, ichar='.', npre=0)
 def checkfir(txt, **conargs):
-  return contextsearch(txt, priptn_fir, secptn_fir, ichar='.', npre=0)
+  return conrule_fir.search(txt)
 
 # Check stick function
 priptn_stick = [
@@ -54,9 +57,9 @@ priptn_stick = [
 negptn_stick = [
   'convol',
 ]
+conrule_stick = ContextRule(priptn_stick, negptn=negptn_stick, ichar='.')
 def checkstick(txt, **conargs):
-  return contextsearch(txt, priptn_stick, negptn=negptn_stick, 
-    ichar='.', **conargs)
+  return conrule_stick.search(txt, **conargs)
 
 # Initialize tags
 tags = {}
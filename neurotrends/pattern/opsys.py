@@ -1,7 +1,7 @@
 cat = 'tool'
 
 # Import base
-from base import *
+from neurotrends.pattern.base import *
 
 # Initialize tags
 tags = {}
@@ -19,8 +19,9 @@ priptn_mac = [
   'mac(?:intosh)',
 ]
 secptn_mac = [].extend(secptn_os)
+conrule_mac = ContextRule(priptn_mac, secptn_mac, ichar='.')
 def checkmac(txt, **conargs):
-  return contextsearch(txt, priptn_mac, secptn_mac, ichar='.')
+  return conrule_mac.search(txt)
 
 priptn_windows = [
   'windows'
@@ -36,8 +37,9 @@ secptn_windows = [
   'millenn?ium',
   'vista',
 ].extend(secptn_os)
+conrule_windows = ContextRule(priptn_windows, secptn_windows, ichar='.')
 def checkwindows(txt, **conargs):
-  return contextsearch(txt, priptn_windows, secptn_windows, ichar='.')
+  return conrule_windows.search(txt)
 
 tags['mac'] = {
   'bool' : [
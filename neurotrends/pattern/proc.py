@@ -1,7 +1,7 @@
 cat = 'analysis'
 
 # Import base 
-from base import *
+from neurotrends.pattern.base import *
 
 num_ptn = '\d*\.?\d+'
 mm_ptn = '(?:mm|milli%smet(?:er|re)s?)' % (delimptn)
@@ -107,8 +107,9 @@ secptn_stc = [
   'sinc%sinterpolat' % (delimptn),
   'spline%sinterpolat' % (delimptn),
 ]
+conrule_stc = ContextRule(priptn_stc, secptn_stc, ichar='.')
 def checkstc(txt, **conargs):
-  return contextsearch(txt, priptn_stc, secptn_stc, ichar='.', **conargs)
+  return conrule_stc.search(txt, **conargs)
 
 # Check skull-stripping
 priptn_strip = [
@@ -117,8 +118,9 @@ priptn_strip = [
 secptn_strip = [
   'strip',
 ]
+conrule_strip = ContextRule(priptn_strip, secptn_strip, ichar='.')
 def checkstrip(txt, **conargs):
-  return contextsearch(txt, priptn_strip, secptn_strip, ichar='.', **conargs)
+  return conrule_strip.search(txt, **conargs)
 
 # Check head motion regression
 priptn_motreg = [
@@ -137,10 +139,13 @@ secptn_motreg = [
 secptn_motreg_strict = [
   'included%sin%sthe%s(?:design|model|glm)' % delimrep(3),
 ]
+conrule_motreg = ContextRule(priptn_motreg, secptn_motreg, ichar='.,:;?')
+conrule_motreg_strict = ContextRule(priptn_motreg, secptn_motreg_strict,
+  ichar='.')
 def checkmotreg(txt, **conargs):
-  return contextsearch(txt, priptn_motreg, secptn_motreg, ichar='.,:;?', **conargs)
+  return conrule_motreg.search(txt, **conargs)
 def checkmotreg_strict(txt, **conargs):
-  return contextsearch(txt, priptn_motreg, secptn_motreg_strict, ichar='.', **conargs)
+  return conrule_motreg_strict.search(txt, **conargs)
 
 # Check normalization
 priptn_norm = [
@@ -160,10 +165,13 @@ secptn_norm = [
   'standard%sspace' % (delimptn),
   'montreal%sneurological%sinstitute' % delimrep(2),
 ]
+conrule_norm = ContextRule(priptn_norm, secptn_norm, ichar='.')
+conrule_norm_context = ContextRule(['(?<!intensity )normali'],
+  ['realign', 'smooth'], ichar='.')
 def checknorm(txt, **conargs):
-  return contextsearch(txt, priptn_norm, secptn_norm, ichar='.', **conargs)
+  return conrule_norm.search(txt, **conargs)
 def checknorm_context(txt, **conargs):
-  return contextsearch(txt, ['(?<!intensity )normali'], ['realign', 'smooth'], ichar='.', **conargs)
+  return conrule_norm_context.search(txt, **conargs)
 
 # Initialize tags
 tags = {}
@@ -1,7 +1,10 @@
 cat = 'tool'
 
+# Scan methods section only
+sections = ['methods']
+
 # Import base
-from base import *
+from neurotrends.pattern.base import *
 
 # Check spiral
 priptn_spiral = [
@@ -17,8 +20,9 @@ secptn_spiral = [
   'acqui',
   'sequence',
 ]
+conrule_spiral = ContextRule(priptn_spiral, secptn_spiral, ichar='.')
 def checkspiral(txt, **conargs):
-  return contextsearch(txt, priptn_spiral, secptn_spiral, ichar='.', **conargs)
+  return conrule_spiral.search(txt, **conargs)
 
 
 tags = {}
@@ -0,0 +1,193 @@
+# Import modules
+import os
+import imp
+import hashlib
+import tempfile
+import collections
+import cPickle as pickle
+
+# Import base
+from base import comptag, tagrules
+from scan import GroupScanner
+
+# Package of tag modules, which import library modules from it
+package = 'neurotrends.pattern'
+
+class TagRegistry(collections.Mapping):
+  """
+  Tag groups by name. Each group is loaded and compiled on first
+  access; compiled groups are cached on disk, keyed by a hash of the
+  pattern module sources, so that new processes can skip compilation.
+  Arguments:
+    moddir (str): Pattern module directory
+    groups (list): Names of pattern modules
+    cachedir (str): Cache directory; if None, do not cache
+  """
+
+  def __init__(self, moddir, groups, cachedir=None):
+
+    self.moddir = moddir
+    self.groups = sorted(groups)
+    self.cachedir = cachedir
+    self.loaded = {}
+    self._digest = None
+    self._prints = {}
+
+  def __getitem__(self, group):
+
+    if group not in self.groups:
+      raise KeyError(group)
+    if group not in self.loaded:
+      self.loaded[group] = self.load(group)
+
+    return self.loaded[group]
+
+  def __iter__(self):
+    return iter(self.groups)
+
+  def __len__(self):
+    return len(self.groups)
+
+  def digest(self):
+    """
+    Get hash of pattern module sources
+    """
+
+    if self._digest is None:
+      sha = hashlib.sha1()
+      # Pickled classes depend on the package path
+      sha.update(__name__)
+      for name in sorted(os.listdir(self.moddir)):
+        if not name.endswith('.py'):
+          continue
+        sha.update(name)
+        with open(os.path.join(self.moddir, name), 'rb') as f:
+          sha.update(f.read())
+      self._digest = sha.hexdigest()
+
+    return self._digest
+
+  def fingerprint(self, group):
+    """
+    Get hash of what a tag group's results depend on: the sources of
+    library modules and of the group's module, and the compiled rules,
+    which may also depend on data files
+    Arguments:
+      group (str): Group name
+    """
+
+    if group not in self._prints:
+      sha = hashlib.sha1()
+      for name in sorted(os.listdir(self.moddir)):
+        if not name.endswith('.py'):
+          continue
+        # Skip other groups' modules
+        if name[:-3] in self.groups and name[:-3] != group:
+          continue
+        sha.update(name)
+        with open(os.path.join(self.moddir, name), 'rb') as f:
+          sha.update(f.read())
+      src = self[group]['src']
+      for tag in sorted(src):
+        sha.update(repr(tag))
+        # Sort rules, which may be built from dicts
+        for string in sorted([repr(getattr(rule, 'string', None))
+            for rule in tagrules(src[tag])]):
+          sha.update(string)
+      self._prints[group] = sha.hexdigest()
+
+    return self._prints[group]
+
+  def cachefile(self, group):
+    return os.path.join(self.cachedir, '%s-%s.pickle' % (group, self.digest()))
+
+  def load(self, group):
+    """
+    Get compiled tag group from cache, building it if needed
+    Arguments:
+      group (str): Group name
+    """
+
+    if self.cachedir:
+      taggroup = self.readcache(group)
+      if taggroup is not None:
+        return taggroup
+
+    taggroup = self.build(group)
+
+    if self.cachedir:
+      self.writecache(group, taggroup)
+
+    return taggroup
+
+  def build(self, group):
+    """
+    Load and compile tag group from its pattern module
+    Arguments:
+      group (str): Group name
+    """
+
+    # Load tag module under the package name, so that it does not
+    # shadow top-level modules and pickled rules can be imported
+    f, filename, description = imp.find_module(group, [self.moddir])
+    try:
+      modtmp = imp.load_module('%s.%s' % (package, group), f, filename,
+        description)
+    finally:
+      if f:
+        f.close()
+
+    # Compile tags
+    for tag in modtmp.tags:
+      modtmp.tags[tag] = comptag(modtmp.tags[tag])
+      # Label rules for reports
+      for rule in tagrules(modtmp.tags[tag]):
+        rule.group, rule.tag = group, tag
+
+    # Get category
+    if 'cat' in dir(modtmp):
+      cat = modtmp.cat
+    else:
+      cat = 'n/a'
+
+    # Get sections to scan; if None, scan full text
+    sections = getattr(modtmp, 'sections', None)
+
+    return {
+      'cat' : cat,
+      'sections' : sections,
+      'src' : modtmp.tags,
+      'scanner' : GroupScanner(modtmp.tags),
+    }
+
+  def readcache(self, group):
+
+    try:
+      with open(self.cachefile(group), 'rb') as f:
+        return pickle.load(f)
+    except Exception:
+      # Missing or unreadable cache; rebuild
+      return None
+
+  def writecache(self, group, taggroup):
+
+    try:
+      data = pickle.dumps(taggroup, pickle.HIGHEST_PROTOCOL)
+    except (pickle.PicklingError, TypeError, AttributeError):
+      # Groups with unpicklable rules (e.g. lambdas) are not cached
+      return
+
+    # Write to temporary file and rename, so that concurrent
+    # processes never read a partial cache file
+    tmpname = None
+    try:
+      if not os.path.isdir(self.cachedir):
+        os.makedirs(self.cachedir)
+      fd, tmpname = tempfile.mkstemp(dir=self.cachedir,
+        prefix=group + '-', suffix='.tmp')
+      with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+      os.rename(tmpname, self.cachefile(group))
+    except (IOError, OSError):
+      if tmpname and os.path.exists(tmpname):
+        os.remove(tmpname)
@@ -0,0 +1,144 @@
+# Import modules
+import time
+
+# Import base
+from backend import ruledesc
+
+# Profiling is off unless enabled
+options = {
+  'enabled' : False,
+}
+
+class Stat(object):
+  """
+  Call count, total and maximum time, and hit count for one rule,
+  context search, tag, or group
+  """
+
+  def __init__(self):
+    self.count = 0
+    self.total = 0.
+    self.max = 0.
+    self.hits = 0
+
+  def add(self, elapsed, hit):
+    self.count += 1
+    self.total += elapsed
+    self.max = max(self.max, elapsed)
+    if hit:
+      self.hits += 1
+
+  def hitrate(self):
+    if not self.count:
+      return 0.
+    return float(self.hits) / self.count
+
+# Statistics by kind (rule, context, tag, group) and key
+stats = {}
+
+def enable():
+  options['enabled'] = True
+
+def disable():
+  options['enabled'] = False
+
+def reset():
+  stats.clear()
+
+def enabled():
+  return options['enabled']
+
+def record(kind, key, start, hit):
+  """
+  Record a timed call
+  Arguments:
+    kind (str): rule, context, tag, or group
+    key (tuple): Identifier within kind
+    start (float): Start time from time.time()
+    hit (bool): Did the call match?
+  """
+
+  elapsed = time.time() - start
+  kindstats = stats.setdefault(kind, {})
+  if key not in kindstats:
+    kindstats[key] = Stat()
+  kindstats[key].add(elapsed, hit)
+
+def rulekey(rule):
+  """
+  Get key of a rule: (group, tag, description)
+  """
+
+  return (
+    getattr(rule, 'group', None),
+    getattr(rule, 'tag', None),
+    ruledesc(rule),
+  )
+
+def top(kind='rule', n=10, by='total'):
+  """
+  Get slowest entries
+  Arguments:
+    kind (str): rule, context, tag, or group
+    n (int): Number of entries
+    by (str): Sort by total or max time
+  Returns list of (key, Stat) tuples
+  """
+
+  items = stats.get(kind, {}).items()
+  items.sort(key=lambda item: getattr(item[1], by), reverse=True)
+
+  return items[:n]
+
+def nevermatched(tags=None):
+  """
+  Get rules that never matched
+  Arguments:
+    tags (TagRegistry): If given, include rules of its loaded groups
+      that were never applied
+  Returns sorted list of rule keys
+  """
+
+  from base import tagrules, VerRule
+
+  keys = set([key for key, stat in stats.get('rule', {}).items()
+    if not stat.hits])
+
+  if tags is not None:
+    for group in tags.loaded:
+      src = tags.loaded[group]['src']
+      for tag in src:
+        for rule in tagrules(src[tag]):
+          # Hits of version extraction are recorded under the version
+          # rules it stands for
+          if isinstance(rule, VerRule):
+            continue
+          key = rulekey(rule)
+          stat = stats.get('rule', {}).get(key)
+          if stat is None or not stat.hits:
+            keys.add(key)
+
+  return sorted(keys)
+
+def report(n=10, tags=None):
+  """
+  Print slowest groups, tags, rules, and context searches, and rules
+  that never matched
+  Arguments:
+    n (int): Number of entries per list
+    tags (TagRegistry): Registry for unapplied rules; see nevermatched
+  """
+
+  for kind in ['group', 'tag', 'rule', 'context']:
+    if kind not in stats:
+      continue
+    print 'Slowest %s entries:' % (kind)
+    for key, stat in top(kind, n):
+      print '  %8.3fs total %8.4fs max %7d calls %5.1f%% hits  %s' % \
+        (stat.total, stat.max, stat.count, 100 * stat.hitrate(),
+          '/'.join([unicode(part) for part in key]))
+
+  never = nevermatched(tags)
+  print 'Rules that never matched: %d' % (len(never))
+  for key in never[:n]:
+    print '  %s' % ('/'.join([unicode(part) for part in key]))
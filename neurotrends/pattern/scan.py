@@ -0,0 +1,133 @@
+# Import modules
+import re
+import time
+
+# Import base
+from base import *
+
+class GroupScanner(object):
+  """
+  Single-pass scanner for the regular-expression rules of a tag group.
+  Each rule is keyed on a required literal (its anchor); documents are
+  scanned once for all anchors, and only rules whose anchors are present
+  are matched, starting from the first anchor occurrence.
+  Arguments:
+    src (dict): Compiled tags from a pattern module
+  """
+
+  def __init__(self, src):
+
+    # Rules as (tag, rule, anchors, maxpre)
+    self.rules = []
+    self.index = {}
+
+    for tag in src:
+
+      # Get Boolean rules
+      if type(src[tag]) == dict:
+        rules = src[tag]['bool']
+      elif type(src[tag]) == list:
+        rules = src[tag]
+      else:
+        continue
+
+      for rule in rules:
+
+        # Skip functions and arbitrary-version rules
+        if rule.string is None or rule.arbit:
+          continue
+
+        frag = anchor(rule.string, rule.flags)
+        if frag:
+          alts, maxpre = frag
+        else:
+          alts, maxpre = (), None
+
+        self.index[rule] = len(self.rules)
+        self.rules.append((tag, rule, alts, maxpre))
+
+    # Build anchor pattern; longest anchors first
+    anchors = set([alt for _, _, alts, _ in self.rules for alt in alts])
+    anchors = sorted(anchors, key=lambda alt: (-len(alt), alt))
+    self.anchors = anchors
+    self.regex = None
+
+    # Find anchors that may be hidden by overlapping anchor matches
+    self.overlaps = {}
+    for alt in anchors:
+      for other in anchors:
+        if other == alt:
+          continue
+        if any([other[off:off + len(alt)] == alt[:len(other) - off]
+            for off in range(len(other))]):
+          self.overlaps.setdefault(alt, []).append(other)
+
+  def __getstate__(self):
+    # Anchor pattern is rebuilt on first scan
+    state = self.__dict__.copy()
+    state['regex'] = None
+    return state
+
+  def covers(self, rule):
+    return rule in self.index
+
+  def scan(self, txt):
+    """
+    Find all rules matching a document
+    Arguments:
+      txt (str/DocView): Document text
+    Returns dict of tag -> list of (Rule, match) for matching rules;
+    matches are against the space-padded text, as in flexsearch
+    """
+
+    if isinstance(txt, DocView):
+      padded, lower = txt.padded, txt.padlower
+    else:
+      padded = ' ' + txt + ' '
+      lower = padded.lower()
+
+    # Positions are only valid if case-folding preserves length
+    aligned = len(lower) == len(padded)
+
+    # Find first position of each anchor in one pass
+    if self.regex is None and self.anchors:
+      self.regex = re.compile(
+        '|'.join([re.escape(alt) for alt in self.anchors]), re.U)
+    first = {}
+    if self.regex:
+      for match in self.regex.finditer(lower):
+        first.setdefault(match.group(), match.start())
+
+    # Recover anchors skipped by overlapping matches
+    for alt in self.overlaps:
+      if any([other in first for other in self.overlaps[alt]]):
+        if isinstance(lower, str):
+          pos = lower.find(alt.encode('utf-8'))
+        else:
+          pos = lower.find(alt)
+        if pos > -1:
+          first[alt] = pos
+
+    # Match candidate rules
+    profile = ruleprof.options['enabled']
+    hits = {}
+    for tag, rule, alts, maxpre in self.rules:
+
+      start = 0
+      if alts:
+        pos = [first[alt] for alt in alts if alt in first]
+        if not pos or not rule.passes(lower):
+          continue
+        if aligned and maxpre is not None:
+          start = max(0, min(pos) - maxpre)
+
+      if profile:
+        rulestart = time.time()
+      match = runrule(rule, txt, rule.regex.search, padded, start)
+      if profile:
+        ruleprof.record('rule', ruleprof.rulekey(rule), rulestart,
+          match is not None)
+      if match:
+        hits.setdefault(tag, []).append((rule, match))
+
+    return hits
@@ -1,7 +1,10 @@
 cat = 'analysis'
 
+# Scan methods section only
+sections = ['methods']
+
 # Import base
-from base import *
+from neurotrends.pattern.base import *
 
 # Initialize tags
 tags = {}
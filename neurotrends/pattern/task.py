@@ -1,7 +1,7 @@
 cat = 'tool'
 
 # Import base
-from base import *
+from neurotrends.pattern.base import *
 
 ###############
 # Define tags #
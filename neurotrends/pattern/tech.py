@@ -1,7 +1,7 @@
 cat = 'analysis'
 
 # Import base
-from base import *
+from neurotrends.pattern.base import *
 
 # Initialize tags
 tags = {}
@@ -18,9 +18,10 @@ priptn_kda = [
 negptn_kda = [
   'multi%slevel' % (delimptn),
 ]
+conrule_kda = ContextRule(priptn_kda, negptn=negptn_kda, ichar='.',
+  npre=25, npost=0)
 def checkkda(txt, **conargs):
-  return contextsearch(txt, priptn_kda, negptn=negptn_kda, 
-    ichar='.', npre=25, npost=0, **conargs)
+  return conrule_kda.search(txt, **conargs)
 
 tags['kda'] = [
   re.compile('\WKDA\W'),
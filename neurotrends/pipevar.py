@@ -6,17 +6,22 @@ from scipy.stats import norm
 # Import project modules
 from tagplot import *
 
-def checkart(art, attribs):
+def checkart(attids, attribs):
   
-  art = toart(art)
-  return any([attrib in art.attribs for attrib in attribs])
+  return any([attrib.id in attids for attrib in attribs])
 
-def getpipe(art, attgrps):
+def getpipe(attids, attgrps):
+  """
+  Get pipeline of an article
+  Arguments:
+    attids (set): IDs of article's Attribs
+    attgrps (dict): Lists of Attribs by pipeline step
+  """
 
   pipe = {}
 
   for attgrp in attgrps:
-    pipe[attgrp] = checkart(art, attgrps[attgrp])
+    pipe[attgrp] = checkart(attids, attgrps[attgrp])
 
   return pipe
 
@@ -57,17 +62,25 @@ def varbyyear(attmaps):
     print 'Working on year %d...' % (year)
 
     syear = str(year)
-    arts = session.query(Article)\
+    arts = session.query(Article.id)\
       .filter(Article.pubyear == syear)\
       .filter(orfilt)\
       .all()
+
+    # Get Attribs of articles from TagFacts
+    artatts = {}
+    facts = session.query(TagFact.article_id, TagFact.attrib_id)\
+      .filter(TagFact.pubyear == syear)\
+      .filter(TagFact.hasdoc == True)
+    for artid, attid in facts:
+      artatts.setdefault(artid, set()).add(attid)
     
     for attmap in attmaps:
 
       pipeyear = []
 
-      for art in arts:
-        pipeyear.append(getpipe(art, attmaps[attmap]))
+      for artid, in arts:
+        pipeyear.append(getpipe(artatts.get(artid, set()), attmaps[attmap]))
 
       pipetot[attmap].extend(pipeyear)
       
@@ -1,6 +1,8 @@
 
 from collections import OrderedDict
 
+from neurotrends import corpus
+
 def list2string(list, delim):
   return delim.join([str(x).lower() for x in list])
 
@@ -24,13 +26,7 @@ def arts2csv(out_name, xtra_vars=['pmid', 'doi'], delim=','):
   out_file = open(out_name, 'w')
   
   # Get articles
-  arts = session.query(Article)\
-    .filter(or_(
-      Article.htmlval >= 0.9,
-      Article.pdfval >= 0.9
-      ))\
-    .order_by(Article.pmid)\
-    .all()
+  arts = corpus.query(minval=0.9).all()
     
   print 'Writing %d articles to text...' % (len(arts))
   
@@ -1,3 +1,4 @@
+from neurotrends import corpus
 
 
 def get_tasks():
@@ -5,9 +6,8 @@ def get_tasks():
     tasks = []
     task_ptn = re.compile('(?:an?|the) ([\w\-]+) task', re.I)
 
-    for art in session.query(Article):
+    for art, html, _, _ in corpus.iterdocs(doc_types=['html'], order=None):
         print 'Working on article %s...' % (art.pmid)
-        html = loadhtml(art)
         if html:
             search = task_ptn.search(html)
             if search:
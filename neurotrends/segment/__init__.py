@@ -0,0 +1,152 @@
+'''
+Article sections by publisher. Segmenters extract the text of a
+section (e.g. methods) from raw HTML; the section is then located in
+the clean HTML text, so that it can be stored as offsets.
+'''
+
+# Imports
+import os
+import re
+import hashlib
+import HTMLParser
+
+# Project imports
+import highwire
+import science_direct
+
+parser = HTMLParser.HTMLParser()
+
+# Segmenters: publisher -> section -> function of raw HTML, returning
+# section text or None
+segmenters = {}
+
+# Detectors: publisher -> function of raw HTML, for articles whose
+# publisher is unknown or hosted by another platform
+detectors = {}
+
+def register(publisher, section, extract, detect=None):
+  """
+  Add segmenter to registry
+  Arguments:
+    publisher (str): Publisher name, as in Article.publisher
+    section (str): Section name
+    extract (function): Function of raw HTML returning section text
+    detect (function): Function of raw HTML returning whether the
+      article is from publisher
+  """
+
+  segmenters.setdefault(publisher.lower(), {})[section] = extract
+  if detect is not None:
+    detectors[publisher.lower()] = detect
+
+register('highwire', 'methods', highwire.extract_method,
+  detect=highwire.is_highwire)
+register('sciencedirect', 'methods', science_direct.extract_methods)
+
+def getsegmenters(publisher, html):
+  """
+  Get segmenters for an article
+  Arguments:
+    publisher (str): Publisher name
+    html (str): Raw HTML
+  Returns dict of section -> function
+  """
+
+  if publisher and publisher.lower() in segmenters:
+    return segmenters[publisher.lower()]
+
+  for name in sorted(detectors):
+    if detectors[name](html):
+      return segmenters[name]
+
+  return {}
+
+# Hash of segmenter sources
+digests = []
+
+def digest():
+  """
+  Get hash of segmenter sources, so that stored offsets can be
+  found again when segmenters change
+  """
+
+  if not digests:
+    sha = hashlib.sha1()
+    moddir = os.path.split(__file__)[0]
+    for name in sorted(os.listdir(moddir)):
+      if name.endswith('.py'):
+        sha.update(name)
+        with open(os.path.join(moddir, name), 'rb') as f:
+          sha.update(f.read())
+    digests.append(sha.hexdigest())
+
+  return digests[0]
+
+# Number of words matched at each end of a section
+nwords = 8
+
+def wordptn(words):
+
+  return re.compile(
+    r'(?<!\w)' + r'\W*'.join([re.escape(word) for word in words]) + r'(?!\w)',
+    re.I | re.U
+  )
+
+def locate(txt, sectxt):
+  """
+  Find section text in document text. Segmenters and HTML parsers
+  may differ in whitespace and punctuation, so the first and last
+  words of the section are matched.
+  Arguments:
+    txt (unicode): Clean document text
+    sectxt (unicode): Section text
+  Returns (start, stop) offsets, or None if not found
+  """
+
+  words = re.findall(r'\w+', parser.unescape(sectxt), re.U)
+  if len(words) < 2 * nwords:
+    return
+
+  # Find start of section
+  match = wordptn(words[:nwords]).search(txt)
+  if not match:
+    return
+  start = match.start()
+
+  # Find end of section
+  match = wordptn(words[-nwords:]).search(txt, match.end())
+  if not match:
+    return
+
+  return start, match.end()
+
+def segment(publisher, html, txt):
+  """
+  Find sections of an article
+  Arguments:
+    publisher (str): Publisher name
+    html (str): Raw HTML
+    txt (unicode): Clean HTML text
+  Returns dict of section -> (start, stop) offsets in txt; sections
+  that could not be found are omitted
+  """
+
+  if not html or not txt:
+    return {}
+
+  offsets = {}
+
+  for section, extract in getsegmenters(publisher, html).iteritems():
+    try:
+      sectxt = extract(html)
+    except Exception:
+      continue
+    if not sectxt:
+      continue
+    if not isinstance(sectxt, unicode):
+      sectxt = sectxt.decode('utf-8', 'replace')
+    span = locate(txt, sectxt)
+    if span:
+      offsets[section] = span
+
+  return offsets
@@ -18,8 +18,8 @@ def extract_method(html):
   
   soup = BS(html)
 
-  methods_section = soup.find({'class' : re.compile('methods-materials', re.I)})
+  methods_section = soup.find(attrs={'class' : re.compile('methods-materials', re.I)})
   if not methods_section:
     return
 
-  return ' '.join(methods_section.find(text=True))
+  return ' '.join(methods_section.findAll(text=True))
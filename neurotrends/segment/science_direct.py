@@ -20,12 +20,13 @@ def extract_methods(html):
   
   # Get Table of Contents JSON from HTML
   toc_match = toc_re.search(html)
-  if toc_match:
-    toc_json = toc_match.groups()[0]
-    try:
-      toc = json.loads(toc_json)
-    except:
-      return
+  if not toc_match:
+    return
+  toc_json = toc_match.groups()[0]
+  try:
+    toc = json.loads(toc_json)
+  except:
+    return
   
   # Get ToC sections
   sections = [sect for sect in toc['TOC']]
@@ -43,7 +44,10 @@ def extract_methods(html):
   # Get HTML IDs of methods section and following section
   methods_id = sections[methods_idx]['sID']
   next_idx = methods_idx + 1
-  next_id = sections[next_idx]['sID']
+  if next_idx < len(sections):
+    next_id = sections[next_idx]['sID']
+  else:
+    next_id = None
   
   # Parse HTML
   soup = BS(html)
@@ -63,7 +67,7 @@ def extract_methods(html):
       break
     if hasattr(elm, 'findAll'):
       methods_text += ' ' + ' '.join(elm.findAll(text=True))
-    else:
+    elif elm.string:
       methods_text += ' ' + elm.string
   
   # Return
@@ -8,7 +8,7 @@ from numpy import linspace
 # Project imports
 from trendpath import *
 from trenddb import *
-from pattern import tags as srclist
+from neurotrends.pattern import tags as srclist
 from util import *
 from neurotrends import trendpath
 
@@ -302,104 +302,146 @@ def vers2frame(vers, incvers=None, bintype='year'):
 
     return df
 
+def factcounts(attids, keycol=None, uniq=True):
+    """
+    Count articles and get coordinates by key and year from TagFacts
+    Arguments:
+        attids (list): Attrib IDs
+        keycol (Column): TagFact column to group by; if None, group
+            all Attribs under 'any'
+        uniq (bool): Count each article once per key? Otherwise count
+            each article once per Attrib
+    Returns dicts of key -> year -> count and key -> year -> list of 
+    (lon, lat) tuples, with years as strings
+    """
+
+    counts = {}
+    coords = {}
+    if not attids:
+        return counts, coords
+
+    keycols = [keycol] if keycol is not None else []
+    filt = TagFact.attrib_id.in_(attids)
+
+    # Count articles
+    if uniq:
+        nart = func.count(distinct(TagFact.article_id))
+    else:
+        nart = func.count(TagFact.id)
+    rows = session.query(*(keycols + [TagFact.pubyear, nart])).\
+        filter(filt).\
+        group_by(*(keycols + [TagFact.pubyear]))
+    for row in rows:
+        key = row[0] if keycols else 'any'
+        counts.setdefault(key, {})[row[-2]] = row[-1]
+
+    # Get coordinates of articles with places
+    rows = session.query(*(keycols + [TagFact.pubyear, TagFact.article_id,
+            Place.lon, Place.lat])).\
+        join(Place, Place.id == TagFact.place_id).\
+        filter(filt)
+    if uniq:
+        rows = rows.distinct()
+    for row in rows:
+        key = row[0] if keycols else 'any'
+        coords.setdefault(key, {}).setdefault(row[-4], []).\
+            append((row[-2], row[-1]))
+
+    return counts, coords
+
 def plotvals(supname, tagname='none', plottype='tag', tagver='none', 
         anytag=False, uniq=True, normbyart=False, exc=[]):
+    """
+    Count articles by tag, version, or value and year. Attribs are
+    found as in gettags; articles are counted from TagFacts.
+    """
     
     # Normalize by published articles for <any> plots
     if anytag:
         normbyart=True
 
-    # Get tags
-    if plottype == 'tag':
-        if type(tagname) != list:
-            tags = getsuptags(supname, tagname)
-        else:
-            tags = tagname
-    else:
-        tags = gettags(supname, tagname=tagname, tagver=tagver, rettype='attrib')
-    
     if plottype == 'tag':
         # Get tags
         fieldstr = supname + 'name'
+        keycol = TagFact.tagname
     elif plottype == 'ver':
         # Get versions
         fieldstr = supname + 'ver'
+        keycol = TagFact.version
     elif plottype == 'val':
         # Get values
         fieldstr = supname + 'value'
+        keycol = TagFact.value
+
+    # Get Attribs and keys
+    if plottype == 'tag':
+        if type(tagname) != list:
+            tags = getsuptags(supname, tagname)
+        else:
+            tags = tagname
+        if tags:
+            attribs = session.query(Attrib).filter(Attrib.fields.any(
+                and_(Field.name == fieldstr, Field.value.in_(tags)))).all()
+        else:
+            attribs = []
+    else:
+        attribs = gettags(supname, tagname, tagver=tagver, rettype='attrib')
+        attribs = [attrib for attrib in attribs if fieldstr in attrib.fields]
+        tags = sorted(set([attrib.fields[fieldstr].value
+            for attrib in attribs]))
+
+    # Count articles
+    attids = [attrib.id for attrib in attribs]
+    if anytag:
+        tags = ['any']
+        counts, coords = factcounts(attids, uniq=True)
+    else:
+        counts, coords = factcounts(attids, keycol, uniq=uniq)
 
     # Initialize
     artct = {}
     artprop = {}
     artcoord = {}
-    
-    tagarts = {}
-    
-    attribs = []
-    for tag in tags:
-        if plottype == 'tag':
-            if anytag:
-                attribs.extend(gettags(supname, tag, 
-                    rettype='attrib', uniq=uniq))
-            else:
-                tagarts[tag] = gettags(supname, tag, 
-                    rettype='article', uniq=uniq)
-        elif plottype == 'ver':
-            tagval = tag.fields[fieldstr].value
-            if anytag:
-                attribs.extend(gettags(supname, tagname, tagver=tagval, 
-                    rettype='attrib', uniq=uniq))
-            else:
-                tagarts[tagval] = gettags(supname, tagname, tagver=tagval, 
-                    rettype='article', uniq=uniq)
-        elif plottype == 'val':
-            tagval = tag.fields[fieldstr].value
-            if anytag:
-                attribs.extend(gettags(supname, tagname, tagval=tagval, 
-                    rettype='attrib', uniq=uniq))
-            else:
-                tagarts[tagval] = gettags(supname, tagname, tagval=tagval, 
-                    rettype='article', uniq=uniq) 
-
-    if anytag:
-        tagarts['any'] = attribs2articles(attribs, uniq=True)
 
-    for tag in tagarts:
+    for tag in tags:
+        tagcounts = counts.get(tag, {})
+        tagcoords = coords.get(tag, {})
         artct[tag] = {
-            'all' : len(tagarts[tag]),
+            'all' : sum(tagcounts.values()),
         }
         artcoord[tag] = {
-            'all' : [(art.place.lon, art.place.lat) for art in tagarts[tag] if art.place]
+            'all' : functools.reduce(operator.add, tagcoords.values(), []),
         }
         for year in qyear:
             syear = str(year)
-            yarts = [art for art in tagarts[tag] if art.pubyear == syear]
-            artct[tag][syear] = len(yarts)
-            artcoord[tag][syear] = [(art.place.lon, art.place.lat) for art in yarts if art.place]
-    
+            artct[tag][syear] = tagcounts.get(syear, 0)
+            artcoord[tag][syear] = tagcoords.get(syear, [])
+
+    # Count published articles by year
+    if normbyart:
+        yearct = dict(session.query(Article.pubyear, func.count(Article.id)).\
+            filter(or_(Article.htmlfile != None, Article.pdftxtfile != None)).\
+            group_by(Article.pubyear).\
+            all())
+
     artct['all'] = {}
     if normbyart:
-        artct['all']['all'] = session.query(Article)\
-            .filter(or_(Article.htmlfile != None, Article.pdftxtfile != None))\
-            .count()
+        artct['all']['all'] = sum(yearct.values())
     else:
-        artct['all']['all'] = sum([artct[tag]['all'] for tag in tagarts])
+        artct['all']['all'] = sum([artct[tag]['all'] for tag in tags])
     artcoord['all'] = {}
     artcoord['all']['all'] = functools.reduce(
-        operator.add, [artcoord[tag]['all'] for tag in tagarts], [])
+        operator.add, [artcoord[tag]['all'] for tag in tags], [])
     for year in qyear:
         syear = str(year)
         if normbyart:
-            artct['all'][syear] = session.query(Article)\
-            .filter(Article.pubyear == syear)\
-            .filter(or_(Article.htmlfile != None, Article.pdftxtfile != None))\
-            .count()
+            artct['all'][syear] = yearct.get(syear, 0)
         else:
-            artct['all'][syear] = sum([artct[tag][syear] for tag in tagarts])
+            artct['all'][syear] = sum([artct[tag][syear] for tag in tags])
         artcoord['all'][syear] = functools.reduce(
-            operator.add, [artcoord[tag][syear] for tag in tagarts], [])
+            operator.add, [artcoord[tag][syear] for tag in tags], [])
 
-    for tag in tagarts:
+    for tag in tags:
         artprop[tag] = {
             'all' : artct[tag]['all'] / float(artct['all']['all']),
         }
@@ -1,27 +1,35 @@
 # Import built-in modules
 import os, re
 import copy
+import json
 import time
-import shelve
+import hashlib
+from cStringIO import StringIO
 
 # Import external modules
 from BeautifulSoup import BeautifulSoup as BS
-from sqlalchemy.orm.exc import MultipleResultsFound
+from sqlalchemy.orm.attributes import instance_state
 import lxml.html
+import lxml.etree
 
 # Set up HTML parser
 import HTMLParser
 parser = HTMLParser.HTMLParser()
 
-# Project imports
+# Project imports; modules are imported by package name, so that
+# running this file as a script does not load second copies of them
 import neurotrends as nt
-from trendpath import *
-from trenddb import *
-from util import *
+from neurotrends import docstore
+from neurotrends import segment
+from neurotrends.trendpath import *
+from neurotrends.trenddb import *
+from neurotrends.util import *
 
 # Import sub-project modules
-from download.pubsearch import *
-from pattern import tags
+from neurotrends.download.pubsearch import *
+from neurotrends.pattern import tags, Document, cleantxt
+from neurotrends.pattern.backend import runrule, setbudget, timeouts
+from neurotrends.pattern import ruleprof
 
 # Import fmri-report
 import sys
@@ -74,6 +82,8 @@ def batchclearattrib(usereport=False):
         nt.session.execute('DELETE FROM fields')
         nt.session.execute('DELETE FROM attribs')
         nt.session.execute('DELETE FROM snippets')
+        nt.session.execute('DELETE FROM tagruns')
+        nt.session.execute('DELETE FROM tagfacts')
     
     else:
         
@@ -94,19 +104,16 @@ def clearattrib(art, commit=True):
     """
     
     art.attribs = []
+    nt.session.query(TagRun).\
+        filter(TagRun.article_id == art.id).\
+        delete()
+    nt.session.query(TagFact).\
+        filter(TagFact.article_id == art.id).\
+        delete()
 
     if commit:
         nt.session.commit()
 
-def cleantxt(txt, ptns):
-    
-    ctxt = txt
-
-    for ptn in ptns:
-        ctxt = re.sub(ptn[0], ptn[1], ctxt)
-
-    return ctxt
-
 def getreparts():
     """
     Get articles from fmri-report
@@ -117,28 +124,217 @@ def getreparts():
         if nt.session.query(Article).filter(Article.pmid == art['pmid']).count()]
     return arts
 
-def batchartparse(usereport=False, groups=[]):
+def batchartparse(usereport=False, groups=[], budget=None, profile=False,
+        presence=True, jobs=1, batch=100, incremental=False):
     """
     Extract meta-data from all articles
     Arguments:
         usereport (bool): Only process articles from fmri-report
         groups (list): Tag groups to process; if empty, process all groups
+        budget (float): Time budget per rule application (s); rules 
+            exceeding it are skipped and reported
+        profile (bool): Time rules, tags, and groups and print report
+        presence (bool): Stop at first hit per tag and skip snippets
+        jobs (int): Number of worker processes; if None, use all CPUs.
+            Workers load and tag documents; this process writes all 
+            results, in article order
+        batch (int): Number of articles per commit
+        incremental (bool): Only process groups whose patterns or 
+            documents changed since their last run on each article, 
+            replacing their Attribs
     """
     
+    # Set rule time budget
+    if budget is not None:
+        setbudget(budget)
+
+    # Start profiling
+    if profile:
+        if jobs != 1:
+            raise Exception('Profiling requires jobs=1')
+        ruleprof.reset()
+        ruleprof.enable()
+
     # Get articles
     if usereport:
-        arts = getreparts()
+        arts = [toart(art) for art in getreparts()]
     else:
         arts = nt.session.query(Article).all()
 
+    # Index Fields and Attribs
+    cache = AttribCache()
+
+    # Write links in bulk
+    links = AttribLinks()
+
+    # Log fingerprints of runs
+    runlog = TagRunLog(incremental)
+
     # Extract tags
-    for artidx in range(len(arts)):
-        
-        print 'Working on article %d of %d...' % (artidx + 1, len(arts))
-        commit = artidx % 100 == 0
-        artparse(arts[artidx], commit, groups=groups)
+    if jobs == 1:
+        # Load documents in the background
+        from neurotrends import corpus
+        docs = corpus.iterdocs(arts, doc_types=['html', 'pdf'])
+        for artidx, (art, html, pdf, _) in enumerate(docs):
+            
+            print 'Working on article %d of %d...' % (artidx + 1, len(arts))
+            commit = artidx % batch == 0
+            artparse(art, commit, groups=groups, presence=presence,
+                cache=cache, links=links, runlog=runlog, texts=(html, pdf))
+    else:
+        poolparse(arts, groups=groups, presence=presence, jobs=jobs, 
+            batch=batch, cache=cache, links=links, runlog=runlog)
 
     # Save changes
+    links.flush()
+    runlog.flush()
+    nt.session.commit()
+
+    # Report rules that exceeded time budget
+    for group, tag, rule, pmid in timeouts:
+        print 'Rule %s (%s/%s) timed out on article %s' % \
+            (rule, group, tag, pmid)
+
+    # Report profile
+    if profile:
+        ruleprof.disable()
+        ruleprof.report(tags=tags)
+
+def batchfacts():
+    """
+    Rebuild TagFacts of all articles from their Attribs
+    """
+
+    refreshfacts(nt.session)
+    nt.session.commit()
+
+class ArtStub(object):
+    """
+    Article columns needed to load, verify, and tag documents, for use
+    in worker processes without a database session
+    Arguments:
+        art (Article): Article object
+    """
+
+    def __init__(self, art):
+
+        self.pmid = art.pmid
+        self.xmlhash = art.xmlhash
+        self.abstxt = art.abstxt
+        # XML is only needed if fields have not been parsed
+        self.xml = art.xml if art.xmlhash is None else None
+        self.affil = art.affil
+        self.publisher = art.publisher
+        self.htmlfile = art.htmlfile
+        self.pdftxtfile = art.pdftxtfile
+        self.pmcfile = art.pmcfile
+        self.htmlval = art.htmlval
+        self.pdfval = art.pdfval
+
+def poolwork(job):
+    """
+    Load and tag documents of an article in a worker process
+    Arguments:
+        job (tuple): ArtStub, tag groups, presence flag, and logged 
+            runs as from TagRunLog.stored
+    Returns tags, verification values, new rule timeouts, and fields
+    parsed from PubMed XML (or None if already stored)
+    """
+
+    stub, groups, presence, stored = job
+    ntimeouts = len(timeouts)
+    parsed = stub.xmlhash is not None
+
+    taggroups = arttags(stub, groups=groups, presence=presence, 
+        stored=stored)
+
+    # Return fields parsed while verifying, so that they are stored
+    meta = None
+    if not parsed and stub.xmlhash is not None:
+        meta = dict([(field, getattr(stub, field)) 
+            for field in ['xmlhash', 'affil'] + infofields])
+
+    return taggroups, stub.htmlval, stub.pdfval, timeouts[ntimeouts:], meta
+
+def poolparse(arts, groups=[], presence=True, jobs=None, batch=1000,
+        cache=None, links=None, runlog=None):
+    """
+    Extract meta-data from articles using a pool of worker processes.
+    Workers never use the database; results are written by this 
+    process in article order, so they do not depend on jobs.
+    Arguments:
+        arts (list): PubMed IDs or Article objects
+        groups (list): Tag groups to process; if [], use all groups
+        presence (bool): Stop at first hit per tag and skip snippets
+        jobs (int): Number of worker processes; if None, use all CPUs
+        batch (int): Number of articles per commit
+        cache (AttribCache): Index of Fields and Attribs; if None,
+            query the database
+        links (AttribLinks): Collect links for bulk writing; written
+            on commit
+        runlog (TagRunLog): Skip unchanged groups and log runs; see 
+            artparse
+    """
+
+    import multiprocessing
+
+    arts = [toart(art) for art in arts]
+
+    # Load tag groups before starting workers
+    for group in groups or tags:
+        tags[group]
+
+    # Start workers
+    nproc = jobs or multiprocessing.cpu_count()
+    pool = multiprocessing.Pool(nproc)
+
+    # Results arrive in article order
+    jobargs = [(ArtStub(art), groups, presence, 
+        runlog.stored(art) if runlog else None) for art in arts]
+    chunksize = max(1, min(50, len(arts) / (4 * nproc)))
+    results = pool.imap(poolwork, jobargs, chunksize)
+
+    try:
+        for artidx, (taggroups, htmlval, pdfval, arttimeouts, meta) in \
+                enumerate(results):
+
+            print 'Writing article %d of %d...' % (artidx + 1, len(arts))
+
+            artobj = arts[artidx]
+            artobj.htmlval = htmlval
+            artobj.pdfval = pdfval
+            timeouts.extend(arttimeouts)
+
+            # Store fields parsed by the worker
+            if meta:
+                for field in meta:
+                    setattr(artobj, field, meta[field])
+
+            if taggroups:
+                artwrite(artobj, taggroups, cache=cache, links=links,
+                    runlog=runlog)
+
+            if (artidx + 1) % batch == 0:
+                if links is not None:
+                    links.flush()
+                if runlog is not None:
+                    runlog.flush()
+                nt.session.commit()
+    except BaseException:
+        # Stop workers without running queued jobs, e.g. on Ctrl-C
+        error = sys.exc_info()
+        pool.terminate()
+        pool.join()
+        raise error[0], error[1], error[2]
+
+    pool.close()
+    pool.join()
+
+    # Save changes
+    if links is not None:
+        links.flush()
+    if runlog is not None:
+        runlog.flush()
     nt.session.commit()
 
 def load_doc(art, doc_type):
@@ -151,27 +347,55 @@ def load_doc(art, doc_type):
         return loadpmc(art)
     raise Exception('Document type %s not implemented' % (doc_type))
 
+def abswords(art):
+    """
+    Get lower-case words of an article's abstract, with surrounding
+    punctuation removed
+    Arguments:
+        art (Article/ArtStub): Article object
+    Returns list of words, or None if no abstract
+    """
+
+    # Get stored abstract
+    if not artmeta(art) or art.abstxt is None:
+        return None
+
+    # Tokenize abstract
+    words = re.split('\s+', art.abstxt)
+    words = [word.lower() for word in words]
+
+    # Ignore punctuation
+    for char in ['.', ',', ';', ':']:
+        words = [word.strip(char) for word in words]
+
+    return words
+
+def wordprop(words, txt):
+    """
+    Get proportion of words that occur in a document. Words are matched
+    as substrings of the lower-case text.
+    Arguments:
+        words (list): Lower-case words
+        txt (unicode): Document text
+    """
+
+    txt = txt.lower()
+    found = [word for word in words if txt.find(word) > -1]
+
+    return float(len(found)) / len(words)
+
 def art_verify(art, doc_types):
     
     # Cast article to Article
     art = toart(art)
 
-    # Get article info
-    info = artinfo({'xml' : art.xml})
+    # Get abstract words
+    abs_words = abswords(art)
 
     # Quit if no abstract
-    if info['abstxt'] is None:
+    if abs_words is None:
         return {}
 
-    # Tokenize abstract
-    abs_txt = info['abstxt']
-    abs_words = re.split('\s+', abstxt)
-    abs_words = [word.lower() for word in abs_words]
-
-    # Ignore punctuation
-    for char in ['.', ',', ';', ':']:
-        abs_words = [word.strip(char) for word in abs_words]
-    
     # Initialize document proportions
     doc_prop = {}
 
@@ -181,140 +405,147 @@ def art_verify(art, doc_types):
         # Load document text
         doc_text = load_doc(art, doc_type)
         doc_text = to_unicode(doc_text)
-        doc_text = doc_text.lower()
         
         # Get document proportions
         if doc_text:
-            doc_words = [word for word in abs_words if doc_text.find(word) > -1]
-            doc_prop[doc_type] = float(len(doc_words)) / len(abs_words)
+            doc_prop[doc_type] = wordprop(abs_words, doc_text)
 
     # Return document proportions
     return doc_prop
 
-def artverify(art, html='', pdf=''):
+def artverify(art, html=None, pdf=None):
     """
     Check whether HTML and PDF documents match abstract text
     Arguments:
-        html (str): HTML text (optional)
-        pdf (str): PDF text (optional)
+        html (str): HTML text; if None, load from cache
+        pdf (str): PDF text; if None, load from cache
     """
 
     # Cast article to Article
     art = toart(art)
 
-    # Get article info
-    info = artinfo({'xml' : art.xml})
+    # Get abstract words
+    words = abswords(art)
 
     # Quit if no abstract
-    if info['abstxt'] is None:
+    if words is None:
         return None, None
 
-    # Tokenize abstract
-    abstxt = info['abstxt']
-    abswords = re.split('\s+', abstxt)
-    abswords = [word.lower() for word in abswords]
-
-    # Ignore punctuation
-    for char in ['.', ',', ';', ':']:
-        abswords = [word.strip(char) for word in abswords]
-
     # Load HTML
-    if not html:
-        html = loadhtml(art, overwrite=True)
+    if html is None:
+        html = loadhtml(art)
     
     # Load PDF
-    if not pdf:
+    if pdf is None:
         pdf = loadpdf(art)
         pdf = to_unicode(pdf)
 
-    # To lower-case
-    html = html.lower()
-    pdf = pdf.lower()
-
     # Check HTML
     if html:
-        htmlwords = [word for word in abswords if html.find(word) > -1]
-        htmlprop = float(len(htmlwords)) / len(abswords)
+        htmlprop = wordprop(words, html)
     else:
         htmlprop = None
 
     # Check PDF
     if pdf:
-        pdfwords = [word for word in abswords if pdf.find(word) > -1]
-        pdfprop = float(len(pdfwords)) / len(abswords)
+        pdfprop = wordprop(words, pdf)
     else:
         pdfprop = None
 
     # Return
     return htmlprop, pdfprop
 
-def loadpmc(art, method='soup'):
+def loadpmc(art, method='fast', overwrite=False):
+    """
+    Load PubMed Central text for an article
+    Arguments:
+        art (str/Article): PubMed ID or Article object
+        method (str): Parsing method (fast, lxml, or soup)
+        overwrite (bool): Re-parse text stored in document store?
+    """
         
     art = toart(art)
+    store = docstore.getstore()
 
     pmcfile = file_path(art.pmid, 'html', file_dirs)
     
     html = ''
 
-    if art.pmcfile and os.path.exists(pmcfile):
+    if art.pmcfile:
+
+        # Load clean text
+        if not overwrite:
+            html = store.get('pmc', art.pmid)
+            if html is not None:
+                return html
+            html = ''
+
+        if os.path.exists(pmcfile):
+
+            html = open(pmcfile, 'r').read()
+            try:
+                html = parsehtml(html, method=method)
+            except:
+                return ''
 
-        html = ''.join(open(pmcfile, 'r').readlines())
-        try:
-            html = parsehtml(html, method=method)
-        except:
-            return ''
+            html = to_unicode(html)
+            if method != 'fast':
+                html = parser.unescape(html)
 
-        html = to_unicode(html)
-        html = parser.unescape(html)
+            # Save clean text
+            store.put('pmc', art.pmid, html)
 
     return html
 
-def loadhtml(art, overwrite=False, method='lxml', raw=False, verbose=False):
+def padcells(html):
+    """
+    Pad table cells of raw HTML with spaces
+    """
+
+    return re.sub(
+        '<td(.*?)>(.*?)</td>', 
+        '<td\\1> \\2 </td>', 
+        html, 
+        flags=re.I
+    )
+
+def loadhtml(art, overwrite=False, method='fast', raw=False, verbose=False):
     """
     Load HTML text for an article
     Arguments:
         art (str/Article): PubMed ID or Article object
-        overwrite (bool): Overwriting existing HTML file?
-        method (str): Parsing method (lxml or soup)
+        overwrite (bool): Re-parse text stored in document store?
+        method (str): Parsing method (fast, lxml, or soup)
         raw (bool): Use unparsed HTML?
         verbose (bool): Print status?
     """
     
     artobj = toart(art)
     htmltxt = ''
+    store = docstore.getstore()
 
     htmlfile = file_path(art.pmid, 'html', file_dirs)
-    chtmlfile = file_path(art.pmid, 'chtml', file_dirs)
-
-    if overwrite and os.path.exists(chtmlfile):
-        os.remove(chtmlfile)
 
     if artobj.htmlfile:
 
-        if os.path.exists(chtmlfile) \
-                and not overwrite \
-                and not raw:
-
-            # Load clean HTML
-            chtml = shelve.open(chtmlfile)
-            htmltxt = chtml['txt']
-
-            # Done
-            if verbose:
-                print 'Finished loading HTML...'
-
-        elif os.path.exists(htmlfile):
+        # Load clean HTML
+        if not overwrite and not raw:
+            htmltxt = store.get('chtml', artobj.pmid)
+            if htmltxt is not None:
+                # Done
+                if verbose:
+                    print 'Finished loading HTML...'
+                return htmltxt
+            htmltxt = ''
+
+        if os.path.exists(htmlfile):
             
             # Convert to plain text
-            html = ''.join(open(htmlfile, 'r').readlines())
+            html = open(htmlfile, 'r').read()
             
-            # Pad TDs
-            html = re.sub(
-                '<td(.*?)>(.*?)</td>', 
-                '<td\\1> \\2 </td>', 
-                html, 
-                flags=re.I
-            )
+            # Pad TDs; the fast parser pads cells in the tree
+            if raw or method != 'fast':
+                html = padcells(html)
             
             # 
             if raw:
@@ -327,12 +558,11 @@ def loadhtml(art, overwrite=False, method='lxml', raw=False, verbose=False):
                 return ''
 
             htmltxt = to_unicode(htmltxt)
-            htmltxt = parser.unescape(htmltxt)
+            if method != 'fast':
+                htmltxt = parser.unescape(htmltxt)
 
             # Save clean HTML
-            chtml = shelve.open(chtmlfile)
-            chtml['txt'] = htmltxt
-            chtml.close()
+            store.put('chtml', artobj.pmid, htmltxt)
 
             # Done
             if verbose:
@@ -353,21 +583,69 @@ def loadpdf(art, verbose=False):
 
     if artobj.pdftxtfile:
 
-        pdftxtfile = file_path(artobj.pmid, 'pdftxt', file_dirs)
-
-        if os.path.exists(pdftxtfile):
+        pdftxt = docstore.getstore().get('pdftxt', artobj.pmid) or ''
             
-            s = shelve.open(pdftxtfile)
-            pdftxt = s['pdfinfo']['txt']
-            
-            # Done
-            if verbose:
-                print 'Finished reading PDF...'
+        # Done
+        if pdftxt and verbose:
+            print 'Finished reading PDF...'
 
     return pdftxt
 
+def loadsections(art, htmltxt=None, overwrite=False, verbose=False):
+    """
+    Load section offsets in the clean HTML text of an article. Offsets
+    are found by the segmenters for the article's publisher and stored
+    with hashes of the text and segmenters, so that they are found
+    again only if either changes.
+    Arguments:
+        art (str/Article): PubMed ID or Article object
+        htmltxt (unicode): Clean HTML text; if None, load text
+        overwrite (bool): Find offsets even if stored?
+        verbose (bool): Print status?
+    Returns dict of section -> (start, stop); sections that could not
+    be found are omitted
+    """
+
+    artobj = toart(art)
+
+    if htmltxt is None:
+        htmltxt = loadhtml(artobj)
+    if not htmltxt:
+        return {}
+
+    store = docstore.getstore()
+    txthash = hashlib.sha1(htmltxt.encode('utf-8')).hexdigest()
+    seghash = segment.digest()
+
+    # Load stored offsets
+    if not overwrite:
+        stored = store.get('sections', artobj.pmid)
+        if stored is not None:
+            stored = json.loads(stored)
+            if stored['txthash'] == txthash and stored['seghash'] == seghash:
+                return dict([(section, tuple(span))
+                    for section, span in stored['sections'].iteritems()])
+
+    # Find sections in raw HTML
+    html = loadhtml(artobj, raw=True)
+    sections = segment.segment(artobj.publisher, html, htmltxt)
+
+    # Save offsets, including failures
+    store.put('sections', artobj.pmid, json.dumps({
+        'txthash' : txthash,
+        'seghash' : seghash,
+        'sections' : sections,
+    }))
+
+    # Done
+    if verbose:
+        print 'Found sections %s...' % (', '.join(sorted(sections)))
+
+    return sections
+
 def artparse(art, commit=True, overwrite=False, verify=True, 
-        groups=[], addsnips=False, verbose=False):
+        groups=[], addsnips=False, presence=False, cache=None, 
+        links=None, runlog=None, texts=None, verbose=False):
     """
     Extract meta-data from article and write to database
     Arguments:
@@ -377,20 +655,88 @@ def artparse(art, commit=True, overwrite=False, verify=True,
         verify (bool): Verify abstract text?
         groups (list): Tag groups to process; if [], use all groups
         addsnips (bool): Save snippets to database?
+        presence (bool): Stop at first hit per tag and skip snippets; 
+            cannot be used with addsnips
+        cache (AttribCache): Index of Fields and Attribs; if None,
+            query the database
+        links (AttribLinks): Collect links for bulk writing; written
+            on commit
+        runlog (TagRunLog): Log fingerprints of this run. If the log
+            is incremental, skip groups whose fingerprints match the 
+            logged run and replace the links of the other groups, which
+            requires links
+        texts (tuple): HTML and PDF texts; see arttags
         verbose (bool): Print status?
     """
     
+    # Snippets are not collected in presence mode
+    if presence and addsnips:
+        raise Exception('Cannot add snippets in presence mode')
+
     # Find article
     artobj = toart(art)
-    
+
+    # Extract tags from documents
+    taggroups = arttags(artobj, overwrite=overwrite, verify=verify, 
+        groups=groups, presence=presence, verbose=verbose,
+        stored=runlog.stored(artobj) if runlog else None, texts=texts)
+
+    # Quit if no docs
+    if taggroups is None:
+        return
+
+    # Add tags to database
+    artwrite(artobj, taggroups, addsnips=addsnips, cache=cache, 
+        links=links, runlog=runlog)
+
+    # Update TagFacts; bulk links update them on flush
+    if links is None:
+        nt.session.flush()
+        refreshfacts(nt.session, [artobj.id])
+
+    # Save changes
+    if commit:
+        if links is not None:
+            links.flush()
+        if runlog is not None:
+            runlog.flush()
+        nt.session.commit()
+
+    # Return tags
+    return taggroups
+
+def arttags(artobj, overwrite=False, verify=True, groups=[], 
+        presence=False, verbose=False, stored=None, texts=None):
+    """
+    Load documents of an article and extract tags
+    Arguments:
+        artobj (Article/ArtStub): Article object
+        overwrite (bool): Overwrite existing data?
+        verify (bool): Verify abstract text?
+        groups (list): Tag groups to process; if [], use all groups
+        presence (bool): Stop at first hit per tag and skip snippets
+        verbose (bool): Print status?
+        stored (dict): Group -> (pattern hash, document hash) of logged
+            runs; if given, skip groups whose hashes are unchanged
+        texts (tuple): HTML and PDF texts, e.g. from corpus.iterdocs;
+            if None, load documents
+    Groups that declare sections scan only those sections of the HTML 
+    text, or all documents if the sections are not found.
+    Returns tags by group as from procdocs, with pattern and document 
+    hashes, or None if no documents
+    """
+
     # Initialize docs
     docs = []
 
-    # Read HTML file
-    htmltxt = loadhtml(artobj, overwrite=overwrite, verbose=verbose)
+    if texts is not None:
+        htmltxt, pdftxt = texts
+    else:
+        # Read HTML file
+        htmltxt = loadhtml(artobj, overwrite=overwrite, verbose=verbose)
 
-    # Read PDF text file
-    pdftxt = loadpdf(artobj, verbose=verbose)
+        # Read PDF text file
+        pdftxt = loadpdf(artobj, verbose=verbose)
     
     # Verify documents
     if verify:
@@ -405,79 +751,374 @@ def artparse(art, commit=True, overwrite=False, verify=True,
     
     # Add HTML document
     if htmltxt and verhtml:
-        docs.append(htmltxt)
+        docs.append(todoc(htmltxt, artobj.pmid))
 
     # Add PDF document
     if pdftxt and verpdf:
-        docs.append(pdftxt)
-    
+        docs.append(todoc(pdftxt, artobj.pmid))
+
     # Quit if no docs
     if not docs:
         return
 
-    # Process docs
-    if groups:
-        procsrc = dict([(group, tags[group]) for group in groups])
+    groups = groups or list(tags)
+
+    # Find sections of HTML if any group scans sections
+    if htmltxt and verhtml and \
+            any([tags[group].get('sections') for group in groups]):
+        sections = loadsections(artobj, htmltxt, overwrite=overwrite,
+            verbose=verbose)
     else:
-        procsrc = tags
+        sections = {}
+
+    # Get documents scanned by each group, sharing documents between
+    # groups that scan the same sections
+    groupdocs = {}
+    sectdocs = {}
+    for group in groups:
+        spans = tuple([sections[section]
+            for section in tags[group].get('sections') or []
+            if section in sections])
+        if not spans:
+            # Scan full text if sections not declared or not found
+            groupdocs[group] = docs
+            continue
+        if spans not in sectdocs:
+            sectdocs[spans] = [todoc(u'\n'.join([htmltxt[start:stop]
+                for start, stop in spans]), artobj.pmid)]
+        groupdocs[group] = sectdocs[spans]
+
+    # Get fingerprints
+    dochashes = {}
+    for group in groups:
+        key = id(groupdocs[group])
+        if key not in dochashes:
+            dochash = hashlib.sha1()
+            for doc in groupdocs[group]:
+                dochash.update(doc.txt.encode('utf-8'))
+                dochash.update('\0')
+                # Tags depend on the cleaned text, so include the clean
+                # patterns (e.g. repchars and repxcept)
+                dochash.update(repr((doc.clean, sorted(doc.xcept.items()))))
+                dochash.update('\0')
+            dochashes[key] = dochash.hexdigest()
+    dochashes = dict([(group, dochashes[id(groupdocs[group])])
+        for group in groups])
+    ptnhashes = dict([(group, tags.fingerprint(group))
+        for group in groups])
+
+    # Process groups, skipping unchanged groups
+    procsrc = dict([(group, tags[group]) for group in groups
+        if stored is None or
+            stored.get(group) != (ptnhashes[group], dochashes[group])])
 
     # Extract tags from documents
-    taggroups = procdocs(docs, procsrc)
+    taggroups = {}
+    for groupdoc in [docs] + sectdocs.values():
+        docsrc = dict([(group, procsrc[group]) for group in procsrc
+            if groupdocs[group] is groupdoc])
+        if docsrc:
+            taggroups.update(procdocs(groupdoc, docsrc, presence=presence))
+    for group in taggroups:
+        taggroups[group]['ptnhash'] = ptnhashes[group]
+        taggroups[group]['dochash'] = dochashes[group]
+
+    return taggroups
+
+class AttribResolver(object):
+    """
+    Find or create Fields and Attribs by canonical key, querying the
+    database for each
+    """
+
+    def field(self, name, value):
+        """
+        Get Field by name and value
+        """
+
+        return upsert(nt.session, Field, fieldkey(name, value), 
+            name=name, value=value)
+
+    def attrib(self, name, category, fields, key):
+        """
+        Get Attrib by Fields
+        Arguments:
+            name (str): Attrib name
+            category (str): Attrib category
+            fields (dict): Field name -> Field
+            key (str): Canonical key, as from attribkey
+        """
+
+        return upsert(nt.session, Attrib, key, 
+            name=name, category=category, fields=fields)
+
+class AttribCache(AttribResolver):
+    """
+    Find or create Fields and Attribs using an in-memory index of all
+    Fields and Attribs by canonical key. The index is loaded once and
+    updated as Fields and Attribs are created, so it is valid until 
+    Fields or Attribs are deleted elsewhere, e.g. by batchclearattrib.
+    """
+
+    def __init__(self):
+
+        self.fields = dict([(fieldobj.key, fieldobj) 
+            for fieldobj in nt.session.query(Field)])
+        self.attribs = dict([(attobj.key, attobj)
+            for attobj in nt.session.query(Attrib)])
+
+    def field(self, name, value):
+
+        key = fieldkey(name, value)
+        if key not in self.fields:
+            self.fields[key] = AttribResolver.field(self, name, value)
+
+        return self.fields[key]
+
+    def attrib(self, name, category, fields, key):
+
+        if key not in self.attribs:
+            self.attribs[key] = AttribResolver.attrib(self, name, category,
+                fields, key)
+
+        return self.attribs[key]
+
+def rowid(obj):
+    """
+    Get primary key of a mapped object without loading its attributes,
+    which expire on commit
+    """
+
+    state = instance_state(obj)
+    if state.key is None:
+        nt.session.flush()
+    return state.key[1][0]
+
+class AttribLinks(object):
+    """
+    Article-Attrib links written in bulk. Links are collected as ID
+    pairs, compared with existing links in one query, and new links 
+    are inserted with COPY on Postgres and executemany otherwise. 
+    TagFacts of written articles are then rewritten. Loaded 
+    Article.attribs collections do not include new links until they 
+    are expired, e.g. by a commit.
+    """
+
+    def __init__(self):
+
+        self.pairs = set()
+        self.drops = {}
+        self.artids = set()
+
+    def touch(self, artobj):
+        """
+        Rewrite TagFacts of an article at flush, e.g. if its 
+        verification values changed
+        """
+
+        self.artids.add(rowid(artobj))
+
+    def add(self, artobj, attobj):
+
+        self.pairs.add((rowid(artobj), rowid(attobj)))
+        self.artids.add(rowid(artobj))
+
+    def drop(self, artobj, group):
+        """
+        Delete existing links of an article to Attribs of a tag group
+        before writing collected links
+        """
+
+        self.drops.setdefault(group, set()).add(rowid(artobj))
+        self.artids.add(rowid(artobj))
+
+    def flush(self):
+        """
+        Write collected links and update TagFacts
+        """
+
+        self.writelinks()
+
+        # Rewrite facts of written articles
+        if self.artids:
+            refreshfacts(nt.session, self.artids)
+            self.artids = set()
+
+    def writelinks(self):
+
+        # Delete dropped links
+        for group in sorted(self.drops):
+            artids = sorted(self.drops[group])
+            for artidx in range(0, len(artids), 500):
+                nt.session.execute(articles_attribs.delete().where(and_(
+                    articles_attribs.c.article_id.in_(
+                        artids[artidx : artidx + 500]),
+                    articles_attribs.c.attrib_id.in_(
+                        select([Attrib.id]).where(Attrib.name == group))
+                )))
+        self.drops = {}
+
+        if not self.pairs:
+            return
+
+        # Get existing links
+        artids = sorted(set([artid for artid, attid in self.pairs]))
+        exists = set()
+        for artidx in range(0, len(artids), 500):
+            exists.update([tuple(row) for row in nt.session.execute(
+                select([
+                    articles_attribs.c.article_id, 
+                    articles_attribs.c.attrib_id
+                ]).where(
+                    articles_attribs.c.article_id.in_(
+                        artids[artidx : artidx + 500])
+                )
+            )])
+        pairs = sorted(self.pairs - exists)
+        self.pairs = set()
+
+        if not pairs:
+            return
+
+        # Insert new links
+        conn = nt.session.connection()
+        if conn.dialect.name == 'postgresql':
+            rows = StringIO(''.join(['%d\t%d\n' % pair for pair in pairs]))
+            conn.connection.cursor().copy_from(rows, 'articles_attribs', 
+                columns=('article_id', 'attrib_id'))
+        else:
+            conn.execute(articles_attribs.insert(), [
+                {'article_id' : artid, 'attrib_id' : attid}
+                for artid, attid in pairs
+            ])
+
+class TagRunLog(object):
+    """
+    Fingerprints of tagging runs by article and tag group, as stored 
+    in TagRun rows. Runs are collected and written in bulk.
+    Arguments:
+        incremental (bool): Load logged runs so that unchanged groups 
+            can be skipped
+    """
+
+    def __init__(self, incremental=True):
+
+        self.incremental = incremental
+        self.runs = {}
+        self.pending = {}
+
+        if incremental:
+            for artid, group, ptnhash, dochash in nt.session.query(
+                    TagRun.article_id, TagRun.taggroup, 
+                    TagRun.ptnhash, TagRun.dochash):
+                self.runs.setdefault(artid, {})[group] = (ptnhash, dochash)
+
+    def stored(self, artobj):
+        """
+        Get logged runs of an article as group -> (pattern hash, 
+        document hash), or None if not incremental
+        """
+
+        if not self.incremental:
+            return None
+        return dict(self.runs.get(rowid(artobj), {}))
+
+    def record(self, artobj, group, ptnhash, dochash):
+
+        self.pending[(rowid(artobj), group)] = (ptnhash, dochash)
+
+    def flush(self):
+        """
+        Write collected runs, replacing earlier runs
+        """
+
+        if not self.pending:
+            return
+
+        # Delete earlier runs
+        bygroup = {}
+        for artid, group in self.pending:
+            bygroup.setdefault(group, []).append(artid)
+        for group in sorted(bygroup):
+            artids = sorted(bygroup[group])
+            for artidx in range(0, len(artids), 500):
+                nt.session.query(TagRun).filter(and_(
+                    TagRun.taggroup == group,
+                    TagRun.article_id.in_(artids[artidx : artidx + 500])
+                )).delete(synchronize_session=False)
+
+        # Insert runs
+        nt.session.execute(TagRun.__table__.insert(), [
+            {
+                'article_id' : artid,
+                'taggroup' : group,
+                'ptnhash' : ptnhash,
+                'dochash' : dochash,
+            }
+            for (artid, group), (ptnhash, dochash) 
+                in sorted(self.pending.items())
+        ])
+
+        if self.incremental:
+            for (artid, group), run in self.pending.items():
+                self.runs.setdefault(artid, {})[group] = run
+        self.pending = {}
+
+def artwrite(artobj, taggroups, addsnips=False, cache=None, links=None,
+        runlog=None):
+    """
+    Add tags to database
+    Arguments:
+        artobj (Article): Article object
+        taggroups (dict): Tags by group as from procdocs
+        addsnips (bool): Save snippets to database?
+        cache (AttribCache): Index of Fields and Attribs; if None,
+            query the database
+        links (AttribLinks): Collect links for bulk writing; if None,
+            add Attribs to artobj.attribs
+        runlog (TagRunLog): Log fingerprints of this run; if 
+            incremental, replace existing links of each group
+    """
+
+    resolver = cache or AttribResolver()
+
+    # Update TagFacts of article when links are flushed
+    if links is not None:
+        links.touch(artobj)
 
-    # Add tags to database
     for groupname in taggroups:
         
         taggroup = taggroups[groupname]
 
+        # Log run
+        if runlog is not None and 'ptnhash' in taggroup:
+            runlog.record(artobj, groupname, taggroup['ptnhash'], 
+                taggroup['dochash'])
+            if runlog.incremental:
+                if links is not None:
+                    links.drop(artobj, groupname)
+                else:
+                    artobj.attribs = [attobj for attobj in artobj.attribs
+                        if attobj.name != groupname]
+
         if not taggroup:
             continue
 
         for tag in taggroup['tags']:
 
-            attobj = []
-
-            # Build Attrib query
-            attq = nt.session.query(Attrib)
-            conq = []
-            foundfield = True
-            fields = {}
-            for field in tag:
-                fieldname = groupname + field
-                fieldvalue = tag[field]
-                try:
-                    fieldobj = nt.session.query(Field).\
-                        filter(
-                            and_(
-                                Field.name == fieldname, 
-                                Field.value == fieldvalue
-                            )
-                        ).one()
-                except MultipleResultsFound, e:
-                    print e
-                    raise
-                except:
-                    fieldobj = Field(name=fieldname, value=fieldvalue)
-                    nt.session.add(fieldobj)
-                    foundfield = False
-                fields[fieldname] = fieldobj
-                if foundfield:
-                    conq.append(Attrib.fields.contains(fieldobj))
-            if conq and foundfield:
-                attq = nt.session.query(Attrib).filter(conq[0])
-                for con in conq[1:]:
-                    attq = attq.intersect(nt.session.query(Attrib).filter(con))
-                attobj = attq.first()
-
-            # Create Attrib if needed
-            if not attobj:
-                attobj = Attrib(
-                    name=groupname,
-                    category=taggroup['cat'],
-                    fields=fields
-                )
+            # Get Fields
+            pairs = [(groupname + field, tag[field]) for field in tag]
+            fields = dict([(name, resolver.field(name, value)) 
+                for name, value in pairs])
+
+            # Get Attrib
+            attobj = resolver.attrib(groupname, taggroup['cat'], fields,
+                attribkey(groupname, pairs))
             
             # Add Attrib to Article
-            if attobj not in artobj.attribs:
+            if links is not None:
+                links.add(artobj, attobj)
+            elif attobj not in artobj.attribs:
                 artobj.attribs.append(attobj)
             
             # Add snippets
@@ -491,13 +1132,6 @@ def artparse(art, commit=True, overwrite=False, verify=True,
                     ]
                     if not any(exsnip):
                         artobj.snippets.append(Snippet(name=groupname, text=sniptxt))
-    
-    # Save changes
-    if commit:
-        nt.session.commit()
-
-    # Return tags
-    return taggroups
 
 def pdfjoin(pdffile):
     
@@ -515,15 +1149,44 @@ def pdfjoin(pdffile):
     # Return
     return pdftxt
     
+# Emit text of an HTML tree in one traversal, dropping scripts, styles,
+# and comments, and padding table cells with spaces
+textxslt = lxml.etree.XSLT(lxml.etree.XML('''
+<xsl:stylesheet version="1.0" 
+    xmlns:xsl="http://www.w3.org/1999/XSL/Transform">
+  <xsl:output method="text" encoding="utf-8"/>
+  <xsl:template match="script|style|comment()|processing-instruction()"/>
+  <xsl:template match="td">
+    <xsl:text> </xsl:text>
+    <xsl:apply-templates/>
+    <xsl:text> </xsl:text>
+  </xsl:template>
+</xsl:stylesheet>
+'''))
+
+def htmltext(html):
+    """
+    Extract text from HTML with a single parse and a single traversal
+    of the parsed tree; see textxslt
+    Arguments:
+        html (str): Raw HTML text
+    """
+
+    return unicode(textxslt(lxml.html.fromstring(html)))
+
 def parsehtml(html, method='soup'):
     """
     Parse HTML document
     Arguments:
         html (str): Raw HTML text
-        method (str): Parsing method (lxml or soup)
+        method (str): Parsing method (fast, lxml, or soup); see htmltext
     """
     
-    if method == 'soup':
+    if method == 'fast':
+
+        txt = htmltext(html)
+
+    elif method == 'soup':
 
         # Parse HTML
         soup = BS(html)
@@ -554,10 +1217,20 @@ def unique(list):
 
     return ulist
 
-def procdocs(docs, tags):
+def procdocs(docs, tags, presence=False):
+    """
+    Extract tags from documents
+    Arguments:
+        docs (list): Document texts or Documents
+        tags (dict): Tag groups to process
+        presence (bool): Stop at first hit per tag and skip snippets
+    """
     
     tagsum = {}
 
+    # Clean each document once for all groups
+    docs = [todoc(doc) for doc in docs]
+
     for src in tags:
 
         taglist = []
@@ -565,9 +1238,15 @@ def procdocs(docs, tags):
         
         # Process documents
         for doc in docs:
-            doctags, docsnips = txt2tag(doc, tags[src]['src'], verbose=False)
+            if ruleprof.enabled():
+                start = time.time()
+            doctags, docsnips = txt2tag(doc, tags[src]['src'], verbose=False,
+                scanner=tags[src].get('scanner'), group=src, 
+                presence=presence)
             taglist.extend(doctags)
             snippets.extend(docsnips)
+            if ruleprof.enabled():
+                ruleprof.record('group', (src,), start, bool(doctags))
 
         # Remove duplicate tags
         taglist = unique(taglist)
@@ -589,98 +1268,207 @@ def procdocs(docs, tags):
 
     return tagsum
 
-def txt2tag(txt, src, verbose=True):
+def todoc(txt, pmid=None):
+    """
+    Wrap text in a Document using the default clean patterns
+    Arguments:
+        txt (str/Document): Document text
+        pmid (str): PubMed ID of source article
+    """
+
+    if isinstance(txt, Document):
+        return txt
+    return Document(txt, repchars, repxcept, pmid=pmid)
+
+def txt2tag(txt, src, verbose=True, scanner=None, group=None, 
+        presence=False):
+    """
+    Extract tags from a document
+    Arguments:
+        txt (str/Document): Document text
+        src (dict): Compiled tags from a pattern module
+        verbose (bool): Print status?
+        scanner (GroupScanner): Scanner for src; if None, apply 
+            rules one at a time
+        group (str): Name of tag group, for profiling
+        presence (bool): Stop at first hit per tag and skip snippets
+    """
     
     # Initialize
     taglist = []
     snippets = []
     
-    # Apply default clean pattern
-    deftxt = cleantxt(txt, repchars)
+    # Get default clean text
+    doc = todoc(txt)
+    deftxt = doc.view()
+
+    # Scan default text for all regex rules at once
+    scanhits = {}
+    if scanner is not None:
+        for tag, hits in scanner.scan(deftxt).items():
+            scanhits.update(hits)
 
     for tag in src:
         
-        # Check for non-default clean pattern
-        if tag in repxcept:
-            srctxt = cleantxt(txt, repxcept[tag])
-        else:
-            srctxt = deftxt
-        
-        foundtag = False
-        foundknownver = False
-        foundarbitver = False
-
-        # Get tag pattern
-        if type(src[tag]) == dict:
-            tagptn = src[tag]['bool']
-        elif type(src[tag]) in [list, type(lambda x: x)]:
-            tagptn = src[tag]
+        # Get clean text for tag
+        srctxt = doc.view(tag)
+
+        if ruleprof.enabled():
+            start = time.time()
+
+        # Scanner results only apply to default text
+        tagvals, tagsnips = tagsearch(tag, src[tag], srctxt, verbose,
+            scanner if srctxt is deftxt else None, scanhits, presence)
+        taglist.extend(tagvals)
+        snippets.extend(tagsnips)
+
+        if ruleprof.enabled():
+            ruleprof.record('tag', (group, tag), start, bool(tagvals))
+
+    return taglist, snippets
+
+def tagsearch(tag, tagsrc, srctxt, verbose=True, scanner=None, scanhits={},
+        presence=False):
+    """
+    Extract one tag from a document
+    Arguments:
+        tag (str): Tag name
+        tagsrc (dict/list): Compiled tag
+        srctxt (DocView): Clean document text
+        verbose (bool): Print status?
+        scanner (GroupScanner): Scanner whose results apply to srctxt
+        scanhits (dict): Rule -> match from scanner
+        presence (bool): Stop at first Boolean hit and skip snippets
+    """
+
+    taglist = []
+    snippets = []
+
+    foundtag = False
+    foundknownver = False
+    foundarbitver = False
+
+    # Get tag pattern
+    if type(tagsrc) == dict:
+        tagptn = tagsrc['bool']
+    elif type(tagsrc) in [list, type(lambda x: x)]:
+        tagptn = tagsrc
+    else:
+        raise Exception('Error: pattern must be a dict, list, or function')
+
+    # Search for tag
+    vals = []
+    for ptn in tagptn:
+        if scanner is not None and scanner.covers(ptn):
+            ruleres = ptn.result(scanhits.get(ptn), srctxt, presence)
         else:
-            raise Exception('Error: pattern must be a dict, list, or function')
-
-        # Search for tag
-        vals = []
-        for ptn in tagptn:
-            ruleres = ptn.apply(srctxt)
-            for val, snip in ruleres:
-                if val:
-                    foundtag = True
-                    vals.append(val)
-                    snippets.append(snip)
+            ruleres = ptn.apply(srctxt, presence=presence)
+        for val, snip in ruleres:
+            if val:
+                foundtag = True
+                vals.append(val)
+                if presence:
                     if verbose:
-                        print 'Found tag %s with context %s' % (tag, snip)
-        
-        # Stop if tag not found
-        if not foundtag:
-            continue
-        
-        # 
-        if type(val) != bool:
-            for val in vals:
-                if type(val) == dict:
-                    val.update({'name' : tag})
-                    taglist.append(val)
-                else:
-                    taglist.append({'name' : tag, 'value' : val})
-            continue
-
-        # Stop if no version info
-        if type(src[tag]) != dict:
-            taglist.append({'name' : tag})
+                        print 'Found tag %s' % (tag)
+                    if val is True:
+                        break
+                    continue
+                snippets.append(snip)
+                if verbose:
+                    print 'Found tag %s with context %s' % (tag, snip)
+        # Later rules cannot change a Boolean tag
+        if presence and foundtag and val is True:
+            break
+    
+    # Stop if tag not found
+    if not foundtag:
+        return taglist, snippets
+    
+    # 
+    if type(val) != bool:
+        for val in vals:
+            if type(val) == dict:
+                val.update({'name' : tag})
+                taglist.append(val)
+            else:
+                taglist.append({'name' : tag, 'value' : val})
+        return taglist, snippets
+
+    # Stop if no version info
+    if type(tagsrc) != dict:
+        taglist.append({'name' : tag})
+        return taglist, snippets
+    
+    # Find versions at tag mentions if possible
+    verx = tagsrc.get('verx')
+    if verx is not None:
+        verhits = runrule(verx, srctxt, verx.findknown, srctxt) or set()
+
+    # Extract version (known)
+    for ver in tagsrc:
+        if ver in ['bool', 'arbit', 'verx']:
             continue
-        
-        # Extract version (known)
-        for ver in src[tag]:
-            if ver in ['bool', 'arbit']:
-                continue
-            verptn = src[tag][ver]
-            for ptn in verptn:
-                if any([res[0] for res in ptn.apply(srctxt)]):
-                    taglist.append({'name' : tag, 'ver' : ver})
-                    foundknownver = True
-
-        # Extract version (arbitrary)
-        if not foundknownver:
-            if 'arbit' in src[tag]:
-                # Initialize arbitrary function with identity
-                arbfun = lambda x: x
-                if type(src[tag]['arbit']) == dict:
-                    arblist = src[tag]['arbit']['src']
-                    if 'fun' in src[tag]['arbit']:
-                        arbfun = src[tag]['arbit']['fun']
+        verptn = tagsrc[ver]
+        for ptnidx, ptn in enumerate(verptn):
+            if verx is not None:
+                verfound = (ver, ptnidx) in verhits
+                # Credit the version rule that verx stands for
+                if ruleprof.enabled():
+                    ruleprof.record('rule', ruleprof.rulekey(ptn),
+                        time.time(), verfound)
+            else:
+                verfound = any([res[0] for res in ptn.apply(srctxt)])
+            if verfound:
+                taglist.append({'name' : tag, 'ver' : ver})
+                foundknownver = True
+
+    # Extract version (arbitrary)
+    if not foundknownver:
+        if 'arbit' in tagsrc:
+            # Initialize arbitrary function with identity
+            arbfun = lambda x: x
+            if type(tagsrc['arbit']) == dict:
+                arblist = tagsrc['arbit']['src']
+                if 'fun' in tagsrc['arbit']:
+                    arbfun = tagsrc['arbit']['fun']
+            else:
+                arblist = tagsrc['arbit']
+            for arbidx, arbptn in enumerate(arblist):
+                if verx is not None:
+                    arbres = runrule(verx, srctxt, verx.findarbit,
+                        srctxt, arbidx) or []
+                    if ruleprof.enabled():
+                        ruleprof.record('rule', ruleprof.rulekey(arbptn),
+                            time.time(), bool(arbres))
                 else:
-                    arblist = src[tag]['arbit']
-                for arbptn in arblist:
                     arbres = arbptn.apply(srctxt)
-                    if arbres:
-                        arbver = [res for res in arbres if res][0]
-                        if type(arbver) == tuple:
-                            arbver = [res for res in arbver if res][0]
-                        if arbver:
-                            taglist.append({'name' : tag, 'ver' : arbfun(arbver)})
-                            foundarbitver = True
+                if arbres:
+                    arbver = [res for res in arbres if res][0]
+                    if type(arbver) == tuple:
+                        arbver = [res for res in arbver if res][0]
+                    if arbver:
+                        taglist.append({'name' : tag, 'ver' : arbfun(arbver)})
+                        foundarbitver = True
 
-        if not (foundknownver or foundarbitver):
-            taglist.append({'name' : tag, 'ver' : ''})
+    if not (foundknownver or foundarbitver):
+        taglist.append({'name' : tag, 'ver' : ''})
 
     return taglist, snippets
+
+if __name__ == '__main__':
+
+    if len(sys.argv) > 1 and sys.argv[1] == 'batch':
+
+        # Get number of worker processes
+        jobs = 1
+        if '--jobs' in sys.argv:
+            jobs = int(sys.argv[sys.argv.index('--jobs') + 1]) or None
+
+        # Only re-tag changed groups and documents
+        incremental = '--incremental' in sys.argv
+
+        batchartparse(jobs=jobs, incremental=incremental)
+
+    elif len(sys.argv) > 1 and sys.argv[1] == 'facts':
+
+        batchfacts()
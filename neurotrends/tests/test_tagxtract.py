@@ -0,0 +1,148 @@
+'''
+Test batch tagging
+'''
+
+# Imports
+import sys
+import types
+import random
+import unittest
+
+# fmri-report scripts are only needed to read the report; tests
+# replace getreparts
+if 'reportproc' not in sys.modules:
+    sys.modules['reportproc'] = types.ModuleType('reportproc')
+
+# Project imports
+import neurotrends as nt
+from neurotrends import tagxtract
+from neurotrends.trenddb import Article
+from neurotrends.pattern import cleantxt
+
+class BatchArtParseTest(unittest.TestCase):
+
+    def setUp(self):
+
+        # Use in-memory database
+        nt.database.configure('sqlite://')
+        nt.session.add(Article(pmid='123'))
+        nt.session.commit()
+
+        # Read PubMed IDs from report and record parsed articles
+        self.parsed = []
+        self.getreparts = tagxtract.getreparts
+        self.artparse = tagxtract.artparse
+        tagxtract.getreparts = lambda: ['123']
+        tagxtract.artparse = lambda art, commit, **kwargs: \
+            self.parsed.append(art)
+
+    def tearDown(self):
+
+        tagxtract.getreparts = self.getreparts
+        tagxtract.artparse = self.artparse
+        nt.database.configure()
+
+    def test_report_serial(self):
+
+        tagxtract.batchartparse(usereport=True, jobs=1)
+
+        self.assertEqual(len(self.parsed), 1)
+        self.assertTrue(isinstance(self.parsed[0], Article))
+        self.assertEqual(self.parsed[0].pmid, '123')
+
+# Phrases for generated texts: known and arbitrary versions, context
+# rules, and near misses
+phrases = [
+    u'SPM 99', u'SPM2', u'SPM5 (Wellcome Department, London)', u'spm8b',
+    u'statistical parametric mapping (SPM 96)', u'SPM: 8', u'SPMs',
+    u'FSL 4.1.2', u'FSL version 3.3', u'FSL 5.0', u'FMRIB Software Library',
+    u'AFNI (version 2.31b)', u'AFNI (afni_2008_07_18_1710)', u'AFNI 2.99z',
+    u'Brain Voyager QX 1.9', u'BrainVoyager 2.8', u'FreeSurfer 5.1.0',
+    u'FreeSurfer 5.3.0', u'MATLAB R2007b', u'Matlab 7.5', u'python',
+    u'R project', u'java', u'javascript', u'E-Prime', u'Windows XP',
+    u'Mac OS X', u'linux', u'slice timing correction',
+    u'corrected for differences in slice acquisition time',
+    u'normalized to the MNI template', u'spatially normalized',
+    u'motion parameters were included as regressors',
+    u'realigned to the first volume', u'coregistered to the T1',
+    u'3 T Siemens scanner', u'1.5 Tesla GE magnet', u'Philips 3T system',
+    u'smoothed with an 8 mm FWHM Gaussian kernel', u'FWHM = 6 mm',
+    u'high-pass filter of 128 s', u'FDR corrected', u'family-wise error',
+    u'event-related design', u'blocked design', u'mixed design',
+    u'canonical hemodynamic response function', u'temporal derivative',
+    u'random effects', u'region of interest', u'echo planar imaging',
+    u'gradient echo', u'spiral in', u'GRAPPA', u'MPRAGE',
+    u'independent component analysis', u'psychophysiological interaction',
+    u'dynamic causal modeling', u'support vector machine', 
+    u'Talairach space', u'MNI space', u'pp. 123\u2013130', u'Monte Carlo',
+]
+filler = (u'the of and to in a was were with for on by as at from that '
+    u'data analysis subjects participants images scanner brain voxel task '
+    u'results methods signal model, performed ; after - during 12 0.05 '
+    u'p < t = ( )').split()
+
+def maketexts(ntexts=60, nwords=120, seed=0):
+    """
+    Generate texts mixing phrases and filler words
+    """
+
+    rand = random.Random(seed)
+    texts = []
+    for _ in range(ntexts):
+        words = [rand.choice(phrases) if rand.random() < 0.15 
+            else rand.choice(filler) for _ in range(nwords)]
+        texts.append(u' '.join(words))
+
+    return texts
+
+def oldtags(txt, src, presence):
+    """
+    Extract tags by applying each rule to plain text, without the
+    group scanner, version extraction, or document index
+    """
+
+    doc = tagxtract.todoc(txt)
+    taglist = []
+    for tag in src:
+        tagsrc = src[tag]
+        if type(tagsrc) == dict:
+            tagsrc = dict([(key, tagsrc[key]) for key in tagsrc 
+                if key != 'verx'])
+        plain = cleantxt(doc.txt, doc.xcept.get(tag, doc.clean))
+        taglist.extend(tagxtract.tagsearch(tag, tagsrc, plain, 
+            verbose=False, presence=presence)[0])
+
+    return taglist
+
+class ScannerTest(unittest.TestCase):
+    """
+    The group scanner, verx, and indexed ContextRules must find the same
+    tags as applying rules one at a time
+    """
+
+    def test_same_tags(self):
+
+        texts = maketexts()
+        versions = set()
+
+        for group in tagxtract.tags:
+            taggroup = tagxtract.tags[group]
+            for presence in [False, True]:
+                for txt in texts:
+                    new = tagxtract.txt2tag(txt, taggroup['src'], 
+                        verbose=False, scanner=taggroup['scanner'], 
+                        presence=presence)[0]
+                    old = oldtags(txt, taggroup['src'], presence)
+                    self.assertEqual(sorted(new), sorted(old), 
+                        '%s tags differ on %r' % (group, txt))
+                    versions.update([(tag['name'], tag['ver']) 
+                        for tag in new if tag.get('ver')])
+
+        # Corpus covers known and arbitrary versions
+        for name, ver in [('spm', '8b'), ('fsl', '4.1.2'), ('afni', '2.31b'),
+                ('fsl', '5.0'), ('afni', '2008_07_18_1710'), 
+                ('surfer', '5.3.0'), ('voyager', '2.8')]:
+            self.assertTrue((name, ver) in versions, (name, ver))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+'''
+Test database helpers
+'''
+
+# Imports
+import os
+import shutil
+import tempfile
+import unittest
+
+# Import SQLAlchemy
+from sqlalchemy import select
+from sqlalchemy.orm import Query
+from sqlalchemy.orm.session import Session
+
+# Project imports
+from neurotrends import trenddb
+from neurotrends.trenddb import Field, Attrib, fieldkey, attribkey, upsert
+
+class MissQuery(Query):
+    """
+    Query whose lookups always miss, as when another writer inserts a
+    row between lookup and insert
+    """
+
+    def first(self):
+        return None
+
+class UpsertTest(unittest.TestCase):
+
+    def setUp(self):
+
+        self.tmpdir = tempfile.mkdtemp()
+        self.db, self.session = trenddb.getdb('sqlite',
+            os.path.join(self.tmpdir, 'test.db'))
+
+        # Writer that inserts first
+        pairs = [('pkgname', 'spm'), ('pkgver', '8')]
+        self.key = attribkey('pkg', pairs)
+        fields = dict([(name, upsert(self.session, Field, 
+            fieldkey(name, value), name=name, value=value))
+            for name, value in pairs])
+        self.attid = upsert(self.session, Attrib, self.key, name='pkg',
+            category='tool', fields=fields).id
+        self.session.commit()
+        self.session.close()
+
+    def tearDown(self):
+
+        self.session.close()
+        self.db.dispose()
+        shutil.rmtree(self.tmpdir)
+
+    def test_concurrent_attrib(self):
+
+        # Writer whose lookup missed the committed row
+        session = Session(bind=self.db, query_cls=MissQuery)
+        fields = dict([(field.name, field) 
+            for field in session.query(Field).all()])
+
+        attobj = upsert(session, Attrib, self.key, name='pkg',
+            category='tool', fields=fields)
+
+        self.assertEqual(attobj.id, self.attid)
+        self.assertEqual(session.query(Attrib).count(), 1)
+        for field in fields.values():
+            self.assertEqual([att.id for att in field.attribs], 
+                [self.attid])
+        session.commit()
+        session.close()
+
+class AttribKeyTest(unittest.TestCase):
+
+    def setUp(self):
+
+        self.tmpdir = tempfile.mkdtemp()
+        self.db, self.session = trenddb.getdb('sqlite',
+            os.path.join(self.tmpdir, 'test.db'))
+
+    def tearDown(self):
+
+        self.session.close()
+        self.db.dispose()
+        shutil.rmtree(self.tmpdir)
+
+    def test_fill_keys(self):
+
+        attribs = Attrib.__table__
+        self.session.execute(attribs.insert(), [
+            {'id' : 1, 'name' : 'des', 'category' : 'design'},
+            {'id' : 2, 'name' : 'task', 'category' : 'design'},
+            {'id' : 3, 'name' : 'des', 'category' : 'design'},
+        ])
+        # Links to a missing Field and to no Field
+        self.session.execute(trenddb.attribs_fields.insert(), [
+            {'attrib_id' : 1, 'field_id' : 99},
+            {'attrib_id' : 2, 'field_id' : None},
+        ])
+
+        trenddb.fillattribkeys(self.session)
+        self.session.commit()
+
+        # Attribs without Fields are distinct by name
+        rows = self.session.execute(select([attribs.c.id, attribs.c.key]).\
+            order_by(attribs.c.id)).fetchall()
+        self.assertEqual(rows, [(1, attribkey('des', [])), 
+            (2, attribkey('task', []))])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,12 +1,20 @@
 # Import built-in modules
 import os
+import json
+import thread
+import hashlib
 
 # Import SQLAlchemy
 from sqlalchemy import *
+from sqlalchemy import event
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import scoped_session
+from sqlalchemy.orm.session import Session as SessionBase
+from sqlalchemy.orm.attributes import get_history, PASSIVE_NO_INITIALIZE
 from sqlalchemy.orm import relationship, backref
 from sqlalchemy.orm.collections import attribute_mapped_collection
+from sqlalchemy.engine import reflection
+from sqlalchemy.exc import IntegrityError, DisconnectionError
 
 # Debug
 echo = False
@@ -18,50 +26,307 @@ datadir = '%s/data' % (rootdir)
 # Files
 dbfile = '%s/fmri-trends.db' % (datadir)
 
+# Default database
+pgurl = 'postgresql+psycopg2://jmcarp@localhost/postgres'
+
+# Environment variables
+urlvars = ['NEUROTRENDS_DB_URL', 'HEROKU_POSTGRESQL_BROWN_URL']
+poolvars = {
+    'pool_size' : 'NEUROTRENDS_DB_POOL_SIZE',
+    'max_overflow' : 'NEUROTRENDS_DB_MAX_OVERFLOW',
+    'pool_recycle' : 'NEUROTRENDS_DB_POOL_RECYCLE',
+    'pool_timeout' : 'NEUROTRENDS_DB_POOL_TIMEOUT',
+}
+
 Base = declarative_base()
 
-def getdb(sqltype='postgres', dbfile=dbfile):
-    
-    # Create engine
+def dburl(sqltype='postgres', dbfile=dbfile):
+    """
+    Get database URL
+    Arguments:
+        sqltype (str): 'sqlite' or 'postgres'; Postgres URLs are read
+            from the environment if set
+        dbfile (str): Path to SQLite database
+    """
+
     if sqltype == 'sqlite':
-        db = create_engine('sqlite:///%s' % (dbfile))
-    elif sqltype == 'postgres':
-        heroku_url = os.environ.get('HEROKU_POSTGRESQL_BROWN_URL')
-        if heroku_url:
-            db = create_engine(heroku_url)
-        else:
-            db = create_engine('postgresql+psycopg2://jmcarp@localhost/postgres', echo=echo)
+        return 'sqlite:///%s' % (dbfile)
+
+    for var in urlvars:
+        if os.environ.get(var):
+            return os.environ[var]
+
+    return pgurl
+
+def pooloptions():
+    """
+    Get connection pool options from the environment
+    """
+
+    return dict(
+        (option, int(os.environ[var]))
+        for option, var in poolvars.iteritems()
+        if os.environ.get(var)
+    )
+
+def getengine(url, **options):
+    """
+    Create database engine. Connections are tagged with the process
+    that opened them, so that processes forked from a parent with open
+    connections (e.g. multiprocessing workers) open their own.
+    Arguments:
+        url (str): Database URL
+        options: Connection pool options; ignored for SQLite
+    """
+
+    if url.startswith('sqlite'):
+        db = create_engine(url, echo=echo)
+        # Let SQLAlchemy manage transactions, so that savepoints work
+        @event.listens_for(db, 'connect')
+        def connect(dbapi_conn, conn_record):
+            dbapi_conn.isolation_level = None
+        @event.listens_for(db, 'begin')
+        def begin(conn):
+            conn.execute('BEGIN')
+    else:
+        db = create_engine(url, echo=echo, **options)
+
+    @event.listens_for(db, 'connect')
+    def setpid(dbapi_conn, conn_record):
+        conn_record.info['pid'] = os.getpid()
+
+    @event.listens_for(db, 'checkout')
+    def checkpid(dbapi_conn, conn_record, conn_proxy):
+        if conn_record.info['pid'] != os.getpid():
+            # Drop without closing; the connection belongs to the parent
+            conn_record.connection = conn_proxy.connection = None
+            raise DisconnectionError(
+                'Connection belongs to process %d' % (conn_record.info['pid'])
+            )
+
+    return db
+
+def setupdb(db, session):
+    """
+    Create tables and check schema version
+    Arguments:
+        db (Engine): Database engine
+        session (Session): Database session
+    """
+
+    # Check for existing schema
+    inspector = reflection.Inspector.from_engine(db)
+    fresh = 'articles' not in inspector.get_table_names()
 
     # Create tables
     Base.metadata.create_all(db)
 
-    # Start session
-    Session = sessionmaker(bind=db)
-    session = Session()
+    # New databases start at the current schema version
+    if fresh:
+        setversion(session, migrations[-1][0])
+    elif getversion(session) < migrations[-1][0]:
+        print 'Database schema is at version %d of %d; run upgrade' % \
+            (getversion(session), migrations[-1][0])
+    session.commit()
+
+def scope():
+    """
+    Session scope: one session per thread per process
+    """
+
+    return os.getpid(), thread.get_ident()
+
+class Database(object):
+    """
+    Lazily created engine and scoped sessions. The engine is created,
+    and the schema checked, when a session is first used. Threads and
+    processes each get their own session from the shared pool; call
+    session.remove() when a thread or request is done with it.
+    """
+
+    def __init__(self, url=None, **options):
+        """
+        Arguments:
+            url (str): Database URL; if None, see dburl
+            options: Connection pool options; if not given, read from
+                the environment
+        """
+
+        self.url = url
+        self.options = options
+        self._engine = None
+        self.lock = thread.allocate_lock()
+        self.session = scoped_session(self.makesession, scopefunc=scope)
+
+    def configure(self, url=None, **options):
+        """
+        Set database URL and pool options. Open sessions are closed
+        and the engine is recreated on next use.
+        Arguments:
+            url (str): Database URL
+            options: Connection pool options
+        """
+
+        self.dispose()
+        self.url = url
+        self.options = options
+
+    @property
+    def engine(self):
+
+        with self.lock:
+            if self._engine is None:
+                options = self.options or pooloptions()
+                db = getengine(self.url or dburl(), **options)
+                session = SessionBase(bind=db)
+                setupdb(db, session)
+                session.close()
+                self._engine = db
+        return self._engine
+
+    def makesession(self):
+
+        return SessionBase(bind=self.engine)
+
+    def dispose(self):
+        """
+        Close session of current thread and connections in pool
+        """
+
+        self.session.remove()
+        if self._engine is not None:
+            self._engine.dispose()
+            self._engine = None
+
+def getdb(sqltype='postgres', dbfile=dbfile):
+    """
+    Connect to a database outside the shared scoped session, e.g. for
+    scripts and benchmarks
+    Arguments:
+        sqltype (str): 'sqlite' or 'postgres'
+        dbfile (str): Path to SQLite database
+    Returns (Engine, Session) tuple
+    """
+
+    database = Database(dburl(sqltype, dbfile))
+    return database.engine, database.session()
+
+##################
+# Canonical keys #
+##################
+
+def fieldkey(name, value):
+    """
+    Get canonical key of a Field. Values are stored as strings, so
+    they are compared as strings.
+    Arguments:
+        name (str): Field name
+        value: Field value
+    """
+
+    if value is not None:
+        value = unicode(value)
+    return hashlib.sha1(json.dumps([name, value])).hexdigest()
+
+def attribkey(name, pairs):
+    """
+    Get canonical key of an Attrib
+    Arguments:
+        name (str): Attrib name
+        pairs (list): (name, value) tuples of Attrib's Fields
+    """
 
-    # Return
-    return db, session
+    return hashlib.sha1(json.dumps([name,
+        sorted([fieldkey(fname, value) for fname, value in pairs])
+    ])).hexdigest()
+
+def upsert(session, model, key, **values):
+    """
+    Get row by canonical key or insert it. Rows are inserted in a 
+    savepoint, so a row inserted concurrently by another writer is
+    returned instead of a duplicate.
+    Arguments:
+        session (Session): Database session
+        model (class): Field or Attrib
+        key (str): Canonical key
+        values (dict): Column and relationship values for a new row
+    """
+
+    query = session.query(model).filter(model.key == key)
+    obj = query.first()
+    if obj is not None:
+        return obj
+
+    # Keep pending changes out of the savepoint
+    session.flush()
+
+    # Create the row only inside the savepoint: relationships to rows
+    # in the session (e.g. Attrib.fields) cascade it into the session,
+    # and begin_nested would flush it outside the savepoint
+    savepoint = session.begin_nested()
+    try:
+        obj = model(**values)
+        session.add(obj)
+        savepoint.commit()
+    except IntegrityError:
+        savepoint.rollback()
+        obj = query.one()
+
+    return obj
+
+#########
+# Types #
+#########
+
+class JSONList(TypeDecorator):
+    """
+    List stored as JSON text
+    """
+
+    impl = Text
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        return json.dumps(value)
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return json.loads(value)
 
 ######################
 # Association tables #
 ######################
 
+# Association tables are indexed in both directions; each pair of rows
+# is linked at most once
+
 # Attribute-Field association
 attribs_fields = Table('attribs_fields', Base.metadata,
     Column('attrib_id', Integer, ForeignKey('attribs.id')),
-    Column('field_id', Integer, ForeignKey('fields.id'))
+    Column('field_id', Integer, ForeignKey('fields.id')),
+    Index('ix_attribs_fields_attrib_field', 'attrib_id', 'field_id',
+        unique=True),
+    Index('ix_attribs_fields_field_attrib', 'field_id', 'attrib_id'),
 )
 
 # Article-Attribute association
 articles_attribs = Table('articles_attribs', Base.metadata,
     Column('article_id', Integer, ForeignKey('articles.id')),
-    Column('attrib_id', Integer, ForeignKey('attribs.id'))
+    Column('attrib_id', Integer, ForeignKey('attribs.id')),
+    Index('ix_articles_attribs_article_attrib', 'article_id', 'attrib_id',
+        unique=True),
+    Index('ix_articles_attribs_attrib_article', 'attrib_id', 'article_id'),
 )
 
 # Article-Author association
 articles_authors = Table('articles_authors', Base.metadata,
     Column('article_id', Integer, ForeignKey('articles.id')),
-    Column('author_id', Integer, ForeignKey('authors.id'))
+    Column('author_id', Integer, ForeignKey('authors.id')),
+    Index('ix_articles_authors_article_author', 'article_id', 'author_id',
+        unique=True),
+    Index('ix_articles_authors_author_article', 'author_id', 'article_id'),
 )
 
 ##########
@@ -89,6 +354,9 @@ class Snippet(Base):
 class Field(Base):
     
     __tablename__ = 'fields'
+    __table_args__ = (
+        Index('ix_fields_name_value', 'name', 'value'),
+    )
 
     # Primary key
     id = Column(Integer, primary_key=True)
@@ -99,9 +367,22 @@ class Field(Base):
     # Field value
     value = Column(String)
 
+    # Canonical key
+    key = Column(String, index=True, unique=True)
+
     def __repr__(self):
         return '<%s:%s>' % (self.name, self.value)
 
+    # Columns that key depends on
+    described = ['name', 'value']
+
+    def describe(self):
+        """
+        Set canonical key from name and value
+        """
+
+        self.key = fieldkey(self.name, self.value)
+
 class Attrib(Base):
     
     __tablename__ = 'attribs'
@@ -116,6 +397,9 @@ class Attrib(Base):
     # Attribute category
     category = Column(String)
 
+    # Canonical key
+    key = Column(String, index=True, unique=True)
+
     # Fields
     fields = relationship('Field', 
         secondary=attribs_fields, 
@@ -127,10 +411,22 @@ class Attrib(Base):
     def __repr__(self):
         return '<%s: %s>' % (self.name, ', '.join([repr(self.fields[f]) for f in self.fields]))
 
+    # Description; set before flush, see describe
     _desc = Column(String, 
         info={'vis' : True, 'full' : 'Description'})
-    def __setattr__(self, key, val):
-        super(Attrib, self).__setattr__(key, val)
+
+    # Columns that key and description depend on
+    described = ['name', 'fields']
+
+    def describe(self):
+        """
+        Set canonical key and description from Fields
+        """
+
+        self.key = attribkey(self.name, [
+            (self.fields[name].name, self.fields[name].value)
+            for name in self.fields
+        ])
         if self.name is None:
             return
         desc = []
@@ -143,11 +439,14 @@ class Attrib(Base):
         ]
         if details:
             desc.append(', '.join(details))
-        super(Attrib, self).__setattr__('_desc', ' '.join(desc))
+        self._desc = ' '.join(desc)
     
 class Author(Base):
     
     __tablename__ = 'authors'
+    __table_args__ = (
+        Index('ix_authors_lastname_frstname', 'lastname', 'frstname'),
+    )
 
     # Primary key
     id = Column(Integer, primary_key=True)
@@ -159,17 +458,24 @@ class Author(Base):
     def __repr__(self):
         return '<%s, %s>' % (self.lastname, self.frstname)
 
+    # Description; set before flush, see describe
     _desc = Column(String,
         info={'vis' : True, 'full' : 'Name'})
-    def __setattr__(self, key, val):
-        super(Author, self).__setattr__(key, val)
+
+    # Columns that description depends on
+    described = ['lastname', 'frstname']
+
+    def describe(self):
+        """
+        Set description from names
+        """
+
         names = []
         if self.lastname:
             names.append(self.lastname)
         if self.frstname:
             names.append(self.frstname)
-        desc = ', '.join(names)
-        super(Author, self).__setattr__('_desc', desc)
+        self._desc = ', '.join(names)
 
 class Place(Base):
     
@@ -179,11 +485,11 @@ class Place(Base):
     id = Column(Integer, primary_key=True)
 
     # Information from Wikipedia
-    wikiname = Column(String)
+    wikiname = Column(String, index=True)
     wikiloc = Column(String)
 
     # Original query
-    orig = Column(String)
+    orig = Column(String, index=True)
     norig = Column(Integer)
 
     # Final query
@@ -248,6 +554,16 @@ class Article(Base):
 
     # PubMed XML
     xml = Column(Text)
+
+    # Fields parsed from PubMed XML; see pubsearch.artstore
+    xmlhash = Column(String)
+    abstxt = Column(Text)
+    kwds = Column(JSONList)
+    grants = Column(JSONList)
+    sponsors = Column(JSONList)
+    fpage = Column(String)
+    lpage = Column(String)
+    auths = Column(JSONList)
     
     # Date
     pubyear = Column(String, index=True,
@@ -306,4 +622,458 @@ class Article(Base):
         cascade='all, delete',
     )
 
-#db, session = getdb()
+class TagRun(Base):
+    """
+    Fingerprints of the last tagging run of a tag group on an article
+    """
+    
+    __tablename__ = 'tagruns'
+    __table_args__ = (
+        Index('ix_tagruns_article_group', 'article_id', 'taggroup', 
+            unique=True),
+    )
+
+    # Primary key
+    id = Column(Integer, primary_key=True)
+
+    # Article and tag group
+    article_id = Column(Integer, ForeignKey('articles.id'))
+    taggroup = Column(String)
+
+    # Hashes of pattern sources and documents
+    ptnhash = Column(String)
+    dochash = Column(String)
+
+class TagFact(Base):
+    """
+    Article-Attrib link with the tag fields and article columns used by
+    analytics, so that trend queries need no joins; see refreshfacts
+    """
+
+    __tablename__ = 'tagfacts'
+    __table_args__ = (
+        Index('ix_tagfacts_group_tag_year', 'taggroup', 'tagname', 
+            'pubyear'),
+        Index('ix_tagfacts_attrib_year', 'attrib_id', 'pubyear'),
+        Index('ix_tagfacts_year', 'pubyear'),
+    )
+
+    # Primary key
+    id = Column(Integer, primary_key=True)
+
+    # Article and Attrib
+    article_id = Column(Integer, ForeignKey('articles.id'), index=True)
+    attrib_id = Column(Integer, ForeignKey('attribs.id'))
+
+    # Tag group and Fields of Attrib
+    taggroup = Column(String)
+    tagname = Column(String)
+    version = Column(String)
+    value = Column(String)
+
+    # Article columns
+    pubyear = Column(String)
+    place_id = Column(Integer, ForeignKey('places.id'))
+
+    # Document flags: HTML or PDF text present, and verification values
+    hasdoc = Column(Boolean)
+    htmlval = Column(Float)
+    pdfval = Column(Float)
+
+class SchemaVersion(Base):
+    """
+    Version of the database schema; see upgrade
+    """
+
+    __tablename__ = 'schemaversion'
+
+    # Primary key
+    id = Column(Integer, primary_key=True)
+
+    # Last applied migration
+    version = Column(Integer)
+
+################
+# Descriptions #
+################
+
+@event.listens_for(SessionBase, 'before_flush')
+def describe(session, context, instances):
+    """
+    Set keys and descriptions of new Fields, Attribs and Authors, and of
+    those whose described columns changed. Descriptions are computed once
+    per flush rather than on each assignment, and never while loading.
+    """
+
+    new = session.new
+    for obj in list(new) + list(session.dirty):
+        if not isinstance(obj, (Field, Attrib, Author)):
+            continue
+        if obj in new or any([
+                # Unloaded columns and collections have not changed
+                get_history(obj, name, PASSIVE_NO_INITIALIZE).has_changes() 
+                for name in obj.described]):
+            obj.describe()
+
+##############
+# Migrations #
+##############
+
+def mergerows(session, table, assoc, column, keep, drop):
+    """
+    Point association rows from one row to another and delete it
+    Arguments:
+        session (Session): Database session
+        table (Table): Table of merged rows
+        assoc (list): (association table, other column) tuples
+        column (str): Name of merged column in association tables
+        keep (int): ID of kept row
+        drop (int): ID of dropped row
+    """
+
+    for assoctable, other in assoc:
+        col = assoctable.c[column]
+        othercol = assoctable.c[other]
+        # Drop associations the kept row already has
+        kept = select([othercol]).where(col == keep)
+        session.execute(assoctable.delete().\
+            where(and_(col == drop, othercol.in_(kept))))
+        session.execute(assoctable.update().\
+            where(col == drop).values({column : keep}))
+    session.execute(table.delete().where(table.c.id == drop))
+
+def fillattribkeys(session):
+    """
+    Fill Attrib keys from their names and Fields, merging duplicates
+    Arguments:
+        session (Session): Database session
+    """
+
+    fields = Field.__table__
+    attribs = Attrib.__table__
+
+    # Get Fields of Attribs; links to missing Fields are skipped
+    attpairs = {}
+    for attid, name, value in session.execute(
+            select([attribs_fields.c.attrib_id, fields.c.name, 
+                fields.c.value]).\
+            select_from(attribs_fields.join(fields, 
+                fields.c.id == attribs_fields.c.field_id))):
+        attpairs.setdefault(attid, []).append((name, value))
+
+    # Fill keys, merging duplicates
+    attkeys = {}
+    for attid, name in session.execute(
+            select([attribs.c.id, attribs.c.name]).order_by(attribs.c.id)):
+        key = attribkey(name, attpairs.get(attid, []))
+        if key in attkeys:
+            mergerows(session, attribs, [(articles_attribs, 'article_id'),
+                (attribs_fields, 'field_id'), 
+                (TagFact.__table__, 'article_id')], 'attrib_id', 
+                attkeys[key], attid)
+            continue
+        attkeys[key] = attid
+        session.execute(attribs.update().where(attribs.c.id == attid).\
+            values(key=key))
+
+def addkeys(db, session):
+    """
+    Add canonical keys to an existing database: add key columns, fill
+    them, merge duplicate Fields and Attribs, and create unique indexes
+    Arguments:
+        db (Engine): Database engine
+        session (Session): Database session
+    """
+
+    inspector = reflection.Inspector.from_engine(db)
+
+    # Add key columns
+    for table in [Field.__table__, Attrib.__table__]:
+        columns = [col['name'] for col in inspector.get_columns(table.name)]
+        if 'key' not in columns:
+            session.execute('ALTER TABLE %s ADD COLUMN key VARCHAR' % 
+                (table.name))
+    
+    # Fill Field keys, merging duplicates
+    fields = Field.__table__
+    fieldkeys = {}
+    for fieldid, name, value in session.execute(
+            select([fields.c.id, fields.c.name, fields.c.value]).\
+            order_by(fields.c.id)):
+        key = fieldkey(name, value)
+        if key in fieldkeys:
+            mergerows(session, fields, [(attribs_fields, 'attrib_id')], 
+                'field_id', fieldkeys[key], fieldid)
+            continue
+        fieldkeys[key] = fieldid
+        session.execute(fields.update().where(fields.c.id == fieldid).\
+            values(key=key))
+
+    # Fill Attrib keys, merging duplicates
+    fillattribkeys(session)
+
+    session.commit()
+
+    # Create unique indexes
+    for table in [Field.__table__, Attrib.__table__]:
+        indexes = [index['name'] for index in inspector.get_indexes(table.name)]
+        for index in table.indexes:
+            if index.name not in indexes and \
+                    [col.name for col in index.columns] == ['key']:
+                index.create(db)
+
+def addinfo(db, session):
+    """
+    Add columns for parsed PubMed fields to an existing database. Fill
+    them with main.batchaddinfo.
+    Arguments:
+        db (Engine): Database engine
+        session (Session): Database session
+    """
+
+    inspector = reflection.Inspector.from_engine(db)
+
+    table = Article.__table__
+    columns = [col['name'] for col in inspector.get_columns(table.name)]
+    for name in ['xmlhash', 'abstxt', 'kwds', 'grants', 'sponsors', 
+            'fpage', 'lpage', 'auths']:
+        if name not in columns:
+            session.execute('ALTER TABLE %s ADD COLUMN %s %s' % 
+                (table.name, name, 
+                    table.c[name].type.compile(dialect=db.dialect)))
+
+    session.commit()
+
+def addtagruns(db, session):
+    """
+    Add table of tagging runs to an existing database
+    Arguments:
+        db (Engine): Database engine
+        session (Session): Database session
+    """
+
+    TagRun.__table__.create(db, checkfirst=True)
+
+def dedupe(session, table):
+    """
+    Delete duplicate rows of an association table
+    Arguments:
+        session (Session): Database session
+        table (Table): Association table
+    """
+
+    cols = list(table.c)
+    dups = session.execute(select(cols).group_by(*cols).\
+        having(func.count() > 1)).fetchall()
+
+    # Replace each set of duplicates with one row
+    for row in dups:
+        values = dict([(col.name, row[col.name]) for col in cols])
+        session.execute(table.delete().where(
+            and_(*[col == values[col.name] for col in cols])))
+        session.execute(table.insert().values(values))
+
+def addindexes(db, session):
+    """
+    Add indexes to an existing database: composite indexes in both
+    directions on association tables, which are unique in one
+    direction, and indexes on the columns Fields, Authors, and Places
+    are looked up by
+    Arguments:
+        db (Engine): Database engine
+        session (Session): Database session
+    """
+
+    inspector = reflection.Inspector.from_engine(db)
+    assoctables = [attribs_fields, articles_attribs, articles_authors]
+
+    # Remove duplicate links before adding unique indexes
+    for table in assoctables:
+        dedupe(session, table)
+    session.commit()
+
+    # Create indexes
+    for table in assoctables + [Field.__table__, Author.__table__, 
+            Place.__table__]:
+        indexes = [index['name'] for index in inspector.get_indexes(table.name)]
+        for index in table.indexes:
+            if index.name not in indexes:
+                index.create(db)
+
+def refreshfacts(session, artids=None, batch=500):
+    """
+    Rewrite TagFacts of articles from their Attribs and columns, using
+    INSERT ... SELECT so that no rows are loaded
+    Arguments:
+        session (Session): Database session
+        artids (list): Article IDs; if None, rebuild all TagFacts
+        batch (int): Number of articles per statement
+    """
+
+    facts = TagFact.__table__
+    arts = Article.__table__
+    atts = Attrib.__table__
+
+    # Get value of the Field of an Attrib named after its group and a
+    # suffix, e.g. pkgver; uses the index on attribs_fields
+    def fieldval(suffix):
+        return select([Field.value]).\
+            select_from(attribs_fields.join(Field.__table__,
+                Field.id == attribs_fields.c.field_id)).\
+            where(and_(attribs_fields.c.attrib_id == atts.c.id,
+                Field.name == atts.c.name + suffix)).\
+            limit(1).as_scalar()
+
+    query = select([
+        articles_attribs.c.article_id,
+        articles_attribs.c.attrib_id,
+        atts.c.name,
+        fieldval('name'),
+        fieldval('ver'),
+        fieldval('value'),
+        arts.c.pubyear,
+        arts.c.place_id,
+        or_(arts.c.htmlfile != None, arts.c.pdftxtfile != None),
+        arts.c.htmlval,
+        arts.c.pdfval,
+    ]).select_from(
+        articles_attribs.\
+            join(arts, arts.c.id == articles_attribs.c.article_id).\
+            join(atts, atts.c.id == articles_attribs.c.attrib_id)
+    )
+    columns = ['article_id', 'attrib_id', 'taggroup', 'tagname', 'version',
+        'value', 'pubyear', 'place_id', 'hasdoc', 'htmlval', 'pdfval']
+
+    # Rebuild all facts
+    if artids is None:
+        session.execute(facts.delete())
+        session.execute(facts.insert().from_select(columns, query))
+        return
+
+    artids = sorted(set(artids))
+    for artidx in range(0, len(artids), batch):
+        batchids = artids[artidx : artidx + batch]
+        session.execute(facts.delete().\
+            where(facts.c.article_id.in_(batchids)))
+        session.execute(facts.insert().from_select(columns, 
+            query.where(articles_attribs.c.article_id.in_(batchids))))
+
+def stalefacts(session):
+    """
+    Get IDs of articles whose TagFacts disagree with the article
+    columns they copy, e.g. after metadata or documents were updated
+    without refreshing facts
+    Arguments:
+        session (Session): Database session
+    """
+
+    facts = TagFact.__table__
+    arts = Article.__table__
+
+    # Compare columns, treating NULLs as equal
+    def differ(factcol, artcol):
+        return or_(factcol != artcol,
+            and_(factcol == None, artcol != None),
+            and_(factcol != None, artcol == None))
+
+    query = select([facts.c.article_id]).distinct().\
+        select_from(facts.join(arts, arts.c.id == facts.c.article_id)).\
+        where(or_(
+            differ(facts.c.pubyear, arts.c.pubyear),
+            differ(facts.c.place_id, arts.c.place_id),
+            facts.c.hasdoc != or_(arts.c.htmlfile != None,
+                arts.c.pdftxtfile != None),
+            differ(facts.c.htmlval, arts.c.htmlval),
+            differ(facts.c.pdfval, arts.c.pdfval),
+        ))
+
+    return [row[0] for row in session.execute(query)]
+
+def addfacts(db, session):
+    """
+    Add TagFacts to an existing database and fill them
+    Arguments:
+        db (Engine): Database engine
+        session (Session): Database session
+    """
+
+    TagFact.__table__.create(db, checkfirst=True)
+    refreshfacts(session)
+    session.commit()
+
+def addnamekeys(db, session):
+    """
+    Recompute Attrib keys, which now include Attrib names, so that
+    Attribs with the same Fields (e.g. none) but different names are
+    not merged
+    Arguments:
+        db (Engine): Database engine
+        session (Session): Database session
+    """
+
+    fillattribkeys(session)
+    session.commit()
+
+# Migrations by schema version, in order; each is applied once to
+# databases created at an earlier version
+migrations = [
+    (1, addkeys),
+    (2, addinfo),
+    (3, addtagruns),
+    (4, addindexes),
+    (5, addfacts),
+    (6, addnamekeys),
+]
+
+def getversion(session):
+    """
+    Get schema version of a database; 0 if never upgraded
+    """
+
+    row = session.query(SchemaVersion).first()
+    if row is None:
+        return 0
+    return row.version
+
+def setversion(session, version):
+
+    row = session.query(SchemaVersion).first()
+    if row is None:
+        row = SchemaVersion()
+        session.add(row)
+    row.version = version
+
+def upgrade(db, session, verbose=True):
+    """
+    Apply migrations newer than the schema version of a database, and
+    refresh stale TagFacts
+    Arguments:
+        db (Engine): Database engine
+        session (Session): Database session
+        verbose (bool): Print status?
+    """
+
+    version = getversion(session)
+    session.commit()
+
+    for target, migration in migrations:
+        if target <= version:
+            continue
+        if verbose:
+            print 'Upgrading schema to version %d (%s)...' % \
+                (target, migration.__name__)
+        migration(db, session)
+        setversion(session, target)
+        session.commit()
+
+    # Refresh TagFacts of articles updated since their facts were written
+    artids = stalefacts(session)
+    if artids:
+        if verbose:
+            print 'Refreshing TagFacts of %d articles...' % (len(artids))
+        refreshfacts(session, artids)
+        session.commit()
+
+# Shared database; engine is created on first use
+database = Database()
+session = database.session
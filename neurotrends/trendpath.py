@@ -36,3 +36,6 @@ for file_type in file_dirs:
     file_dirs[file_type]['base_path'] = dir_path
     if not os.path.exists(dir_path):
         os.mkdir(dir_path)
+
+# Document text store; see docstore
+docstore_dir = '%s/docstore' % (dumpdir)
@@ -1,6 +1,7 @@
 
 # 
 import re
+import itertools
 from scipy.stats import norm
 
 # Import fmri-report
@@ -10,6 +11,7 @@ import reportproc as rp
 
 # Import project modules
 from tagplot import *
+from neurotrends import corpus
 
 # NLTK imports
 import nltk
@@ -17,13 +19,19 @@ from nltk.corpus import stopwords
 from nltk.stem.porter import PorterStemmer
 stemmer = PorterStemmer()
 
-def preproc(art):
+def preproc(art, html=None, pdf=None):
   """
   Extract a cleaned list of tokens from an Article.
+  Arguments:
+    art (Article): Article object
+    html (str): HTML text; if None, load
+    pdf (str): PDF text; if None, load
   """
   
-  html = loadhtml(art)
-  pdf = loadpdf(art)
+  if html is None:
+    html = loadhtml(art)
+  if pdf is None:
+    pdf = loadpdf(art)
 
   text = html + ' ' + pdf
 
@@ -61,17 +69,21 @@ def articles_to_mallet(outname, method):
     if art['proc-slicetime-bool'] in ['TRUE', 'FALSE', 'missing']
     and session.query(Article).filter(Article.pmid == art['pmid']).count()
   ]
+
+  # Load documents in the background
+  docs = corpus.iterdocs([toart(art['pmid']) for art in arts],
+    doc_types=['html', 'pdf'])
   
   # Initialize return list
   out = []
 
   # Process articles
-  for art in arts:
+  for art, (artobj, html, pdf, _) in itertools.izip(arts, docs):
     
     print 'Working on article %s...' % (art['pmid'])
 
     # Get tokens
-    tokens = preproc(toart(art['pmid']))
+    tokens = preproc(artobj, html, pdf)
     
     # Skip if no tokens found
     if not tokens:
@@ -1,10 +1,10 @@
 # Imports
 import os
-import shelve
 
 # Project imports
 import neurotrends as nt
 from neurotrends import util
+from neurotrends import docstore
 from neurotrends import trenddb
 from neurotrends import trendpath
 
@@ -51,6 +51,8 @@ def artxtract(art, scraper=None, commit=True, totiff=False, overwrite=False):
     # Stop if no PDF in record
     if not art.pdffile:
         art.pdftxtfile = None
+        nt.session.flush()
+        trenddb.refreshfacts(nt.session, [art.id])
         if commit:
             nt.session.commit()
         return
@@ -66,17 +68,11 @@ def artxtract(art, scraper=None, commit=True, totiff=False, overwrite=False):
 
     print 'Working on article %s...' % (art.pmid)
 
+    store = docstore.getstore()
     pdftxtfile = util.file_path(art.pmid, 'pdftxt', trendpath.file_dirs)
-    if os.path.exists(pdftxtfile):
-        shelf = shelve.open(pdftxtfile)
-        if isinstance(shelf, shelve.Shelf) \
-                and 'pdfinfo' in shelf \
-                and shelf['pdfinfo']['txt'] \
-                and not overwrite:
-            print 'File already exists'
-            return
-        else:
-            os.remove(pdftxtfile)
+    if store.get('pdftxt', art.pmid) and not overwrite:
+        print 'File already exists'
+        return
 
     # Initialize PDF info
     pdfinfo = None
@@ -112,15 +108,18 @@ def artxtract(art, scraper=None, commit=True, totiff=False, overwrite=False):
     if not pdfinfo:
         return
 
-    # Write text to file
-    shelf = shelve.open(pdftxtfile)
-    shelf['pdfinfo'] = pdfinfo
+    # Write text to store
+    store.put('pdftxt', art.pmid, util.to_unicode(pdfinfo['txt']))
 
     # Update article
     art.pdftxtfile = os.path.split(pdftxtfile)[-1]
     art.pdfocr = pdfinfo['ocr']
     art.pdfdecrypt = pdfinfo['decrypt']
     art.pdfdmethod = pdfinfo['dmethod']
+
+    # Update TagFacts, which record whether documents exist
+    nt.session.flush()
+    trenddb.refreshfacts(nt.session, [art.id])
     
     # Save changes
     if commit: